@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'customer_club.settings')
+# Read endpoints are served by coroutines under ASGI, see customers.urls
+os.environ.setdefault('ASYNC_VIEWS', 'true')
 
 application = get_asgi_application()
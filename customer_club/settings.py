@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'customers.instrumentation.RequestTimingMiddleware',
+    'customers.slowlog.SlowLogMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -128,8 +131,11 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# Serve the read endpoints with async views, set by customer_club.asgi
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'false').lower() == 'true'
+
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'customers.pagination.LimitOffsetCountPagination',
     'PAGE_SIZE': 10
 }
 
@@ -140,6 +146,50 @@ ELASTICSEARCH_DSL = {
     },
 }
 
+# Index changes are queued and sent in _bulk batches by a background thread
+ELASTICSEARCH_DSL_SIGNAL_PROCESSOR = 'customers.indexing.QueuedSignalProcessor'
+ELASTICSEARCH_INDEX_QUEUE = {
+    # False flushes after each commit instead, the test runner turns it off
+    'ASYNC': os.environ.get('ELASTICSEARCH_INDEX_QUEUE_ASYNC', 'true').lower() == 'true',
+    'BATCH_SIZE': 500,
+    'MAX_LAG': 1.0,
+    'MAX_RETRIES': 5,
+}
+
+# Runs the tests with the index queue flushing synchronously
+TEST_RUNNER = 'customer_club.test_runner.TestRunner'
+
+# In-process LRU in front of Redis for detail lookups, invalidated over pub/sub
+LOCAL_DETAIL_CACHE = {
+    'ENABLED': False,
+    'MAX_SIZE': 1000,
+    'TIMEOUT': 5,
+    'CHANNEL': 'cache-invalidation',
+    'STATS_FLUSH_INTERVAL': 10,
+}
+
+# Per-request SQL, cache and Elasticsearch timings, served at /api/metrics/
+REQUEST_TIMING = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0,
+    'SERVER_TIMING': True,
+}
+
+# Opt-in log of slow SQL (with EXPLAIN) and searches from the customers views,
+# see the admin's slow log page and `manage.py slow_log`
+SLOW_LOG = {
+    'ENABLED': False,
+    'QUERY_THRESHOLD': 0.1,
+    'SEARCH_THRESHOLD': 0.2,
+    'MAX_ENTRIES': 200,
+}
+
+# Transactions moved to the archive table by `manage.py archive_transactions`
+TRANSACTION_ARCHIVE = {
+    'AFTER_MONTHS': 24,
+    'BATCH_SIZE': 1000,
+}
+
 # Redis configuration
 REDIS_HOST = 'localhost'
 REDIS_PORT = 6379
@@ -151,7 +201,7 @@ CACHES = {
         "BACKEND": "django_redis.cache.RedisCache",
         "LOCATION": f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}",
         "OPTIONS": {
-            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "CLIENT_CLASS": "customers.instrumentation.TimedRedisClient",
         }
     }
 }
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+Production settings for customer_club, configured from the environment.
+
+Use with DJANGO_SETTINGS_MODULE=customer_club.settings_production. Connection
+reuse is configured for all three backends: persistent database connections
+with health checks, a sized Redis connection pool with socket timeouts and
+Elasticsearch connection pools with retries and optional sniffing. The
+effective pool sizes are logged at startup and checked by `manage.py check`.
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import ASYNC_VIEWS
+
+
+def env(name, default=None):
+    return os.environ.get(name, default)
+
+
+def env_bool(name, default=False):
+    return env(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(name, default):
+    return int(env(name, default))
+
+
+def env_float(name, default):
+    return float(env(name, default))
+
+
+def env_list(name, default=''):
+    return [value.strip() for value in env(name, default).split(',') if value.strip()]
+
+
+SECRET_KEY = env('DJANGO_SECRET_KEY')
+
+DEBUG = env_bool('DJANGO_DEBUG')
+
+ALLOWED_HOSTS = env_list('DJANGO_ALLOWED_HOSTS')
+
+
+# Database: keep connections open between requests and ping them before reuse.
+# Under ASGI connections are per-thread and are not reused across requests,
+# so persistence is off by default there, use a pooler such as PgBouncer instead.
+DATABASES = {
+    'default': {
+        'ENGINE': env('DB_ENGINE', 'django.db.backends.postgresql'),
+        'NAME': env('DB_NAME', 'customer_club'),
+        'USER': env('DB_USER', ''),
+        'PASSWORD': env('DB_PASSWORD', ''),
+        'HOST': env('DB_HOST', 'localhost'),
+        'PORT': env('DB_PORT', '5432'),
+        'CONN_MAX_AGE': env_int('DB_CONN_MAX_AGE', 0 if ASYNC_VIEWS else 60),
+        'CONN_HEALTH_CHECKS': env_bool('DB_CONN_HEALTH_CHECKS', True),
+        'OPTIONS': {
+            'connect_timeout': env_int('DB_CONNECT_TIMEOUT', 5),
+        },
+    }
+}
+
+
+# Redis: one pool per process, sized for the worker's threads plus the
+# index queue and invalidation listener threads.
+REDIS_URL = env('REDIS_URL', 'redis://localhost:6379/1')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': REDIS_URL,
+        'OPTIONS': {
+            'CLIENT_CLASS': 'customers.instrumentation.TimedRedisClient',
+            'SOCKET_CONNECT_TIMEOUT': env_float('REDIS_SOCKET_CONNECT_TIMEOUT', 1.0),
+            'SOCKET_TIMEOUT': env_float('REDIS_SOCKET_TIMEOUT', 1.0),
+            'CONNECTION_POOL_KWARGS': {
+                'max_connections': env_int('REDIS_MAX_CONNECTIONS', 50),
+                'retry_on_timeout': True,
+                'health_check_interval': env_int('REDIS_HEALTH_CHECK_INTERVAL', 30),
+            },
+        },
+    }
+}
+
+
+# Elasticsearch: urllib3 pools keep connections alive, `connections_per_node`
+# sizes each node's pool. Sniffing discovers the other cluster nodes.
+ELASTICSEARCH_DSL = {
+    'default': {
+        'hosts': env_list('ELASTICSEARCH_HOSTS', 'http://localhost:9200'),
+        'connections_per_node': env_int('ELASTICSEARCH_CONNECTIONS_PER_NODE', 10),
+        'request_timeout': env_float('ELASTICSEARCH_REQUEST_TIMEOUT', 10.0),
+        'max_retries': env_int('ELASTICSEARCH_MAX_RETRIES', 3),
+        'retry_on_timeout': True,
+        'http_compress': env_bool('ELASTICSEARCH_HTTP_COMPRESS', True),
+        'sniff_on_start': env_bool('ELASTICSEARCH_SNIFF'),
+        'sniff_on_node_failure': env_bool('ELASTICSEARCH_SNIFF'),
+        'min_delay_between_sniffing': env_float('ELASTICSEARCH_SNIFF_INTERVAL', 60.0),
+    },
+}
+
+LOCAL_DETAIL_CACHE = {
+    'ENABLED': env_bool('LOCAL_DETAIL_CACHE'),
+    'MAX_SIZE': env_int('LOCAL_DETAIL_CACHE_MAX_SIZE', 1000),
+    'TIMEOUT': env_float('LOCAL_DETAIL_CACHE_TIMEOUT', 5.0),
+    'CHANNEL': 'cache-invalidation',
+    'STATS_FLUSH_INTERVAL': env_float('LOCAL_DETAIL_CACHE_STATS_FLUSH_INTERVAL', 10.0),
+}
+
+# Time a sample of the requests, the Server-Timing header is off by default
+# so backend timings are not exposed to clients
+REQUEST_TIMING = {
+    'ENABLED': env_bool('REQUEST_TIMING', True),
+    'SAMPLE_RATE': env_float('REQUEST_TIMING_SAMPLE_RATE', 0.1),
+    'SERVER_TIMING': env_bool('REQUEST_TIMING_SERVER_TIMING'),
+}
+
+SLOW_LOG = {
+    'ENABLED': env_bool('SLOW_LOG'),
+    'QUERY_THRESHOLD': env_float('SLOW_LOG_QUERY_THRESHOLD', 0.1),
+    'SEARCH_THRESHOLD': env_float('SLOW_LOG_SEARCH_THRESHOLD', 0.2),
+    'EXPLAIN': env_bool('SLOW_LOG_EXPLAIN', True),
+    'MAX_ENTRIES': env_int('SLOW_LOG_MAX_ENTRIES', 200),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'customers': {'handlers': ['console'], 'level': env('LOG_LEVEL', 'INFO')},
+    },
+}
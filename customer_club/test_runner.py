@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Test runner that flushes the index queue synchronously.
+
+    A flush thread would contend with the test database, tests that exercise
+    the thread turn `ELASTICSEARCH_INDEX_QUEUE['ASYNC']` back on themselves.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._index_queue_settings = override_settings(
+            ELASTICSEARCH_INDEX_QUEUE={**getattr(settings, 'ELASTICSEARCH_INDEX_QUEUE', {}), 'ASYNC': False},
+        )
+        self._index_queue_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._index_queue_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.urls import path, include
+from customers.admin import slow_log_view
 
 urlpatterns = [
+    path('admin/slow-log/', admin.site.admin_view(slow_log_view), name='slow-log'),
     path('admin/', admin.site.urls),
     path('api/', include('customers.urls')),
 ]
@@ -1,5 +1,9 @@
-from django.contrib import admin
-from .models import Customer
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from .models import Customer, Transaction
+from .slowlog import get_slow_log_setting, slow_log
 # Register your models here.
 
 
@@ -11,3 +15,34 @@ class CustomerAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Customer, CustomerAdmin)
+
+
+class TransactionAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'customer', 'amount', 'date'
+    )
+    list_select_related = ('customer',)
+    raw_id_fields = ('customer',)
+
+
+admin.site.register(Transaction, TransactionAdmin)
+
+
+def slow_log_view(request):
+    """The slow query and search log, most recent first, for superusers."""
+    if not request.user.is_superuser:
+        raise PermissionDenied
+    if request.method == 'POST':
+        slow_log.clear()
+        messages.success(request, 'The slow log was cleared.')
+        return redirect('slow-log')
+
+    kind = request.GET.get('kind') or None
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Slow queries and searches',
+        'entries': slow_log.entries(kind),
+        'kind': kind,
+        'enabled': get_slow_log_setting('ENABLED'),
+    }
+    return TemplateResponse(request, 'admin/customers/slow_log.html', context)
@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class CustomersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'customers'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .checks import log_connection_pools
+        from .instrumentation import instrument_connection, instrument_elasticsearch
+        from .slowlog import log_slow_queries
+
+        # Connect the receivers of the rollups, loyalty scores and cache invalidation
+        from . import signals  # noqa: F401
+
+        log_connection_pools()
+        connection_created.connect(instrument_connection)
+        connection_created.connect(log_slow_queries)
+        instrument_elasticsearch()
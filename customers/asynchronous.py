@@ -0,0 +1,110 @@
+import asyncio
+import weakref
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import Http404
+from django.utils.decorators import classonlymethod
+from elasticsearch import AsyncElasticsearch
+from rest_framework.response import Response
+
+from .cache import get_local_cache_setting
+from .instrumentation import TimedAiohttpHttpNode
+
+_elasticsearch_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_elasticsearch():
+    """Return the AsyncElasticsearch client of the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _elasticsearch_clients.get(loop)
+    if client is None:
+        client = _elasticsearch_clients[loop] = AsyncElasticsearch(
+            **{'node_class': TimedAiohttpHttpNode, **settings.ELASTICSEARCH_DSL['default']})
+    return client
+
+
+class AsyncAPIViewMixin:
+    """
+    Dispatch an APIView or viewset to coroutine handlers.
+
+    Handlers defined with `async def` are awaited on the event loop. Sync
+    handlers, and the authentication and permission checks, run in a thread.
+    """
+
+    @classonlymethod
+    def as_view(cls, *args, **initkwargs):
+        # ViewSetMixin.as_view builds a plain function, mark it so Django awaits it
+        return markcoroutinefunction(super().as_view(*args, **initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncReadModelMixin(AsyncAPIViewMixin):
+    """
+    Serve list and retrieve of a viewset with coroutines.
+
+    The viewset must also use CachedResponseMixin and ConditionalRequestMixin.
+    The same cache entries, validators and paginators are used as by the sync
+    views, through `async_cache` and the async ORM. The other actions keep
+    their sync implementation and run in a thread.
+    """
+
+    async def list(self, request, *args, **kwargs):
+        cache_key = await self.aget_list_cache_key(request)
+        return await self._acached_response(cache_key, self._alist, request, *args, **kwargs)
+
+    async def retrieve(self, request, *args, **kwargs):
+        cache_key = self.get_detail_cache_key(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        local = self.cache_local_tier and get_local_cache_setting('ENABLED')
+        return await self._acached_response(cache_key, self._aretrieve, request, *args, local=local, **kwargs)
+
+    async def _alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return await self._aconditional_response(queryset, self._alist_page, request, *args, **kwargs)
+
+    async def _alist_page(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = None
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        if page is not None:
+            return self.paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        rows = [row async for row in queryset]
+        return Response(self.get_serializer(rows, many=True).data)
+
+    async def _aretrieve(self, request, *args, **kwargs):
+        queryset = self.get_lookup_queryset(self.filter_queryset(self.get_queryset()))
+        if queryset is None:
+            raise Http404
+
+        async def retrieve_object(request, *args, **kwargs):
+            instance = await queryset.afirst()
+            if instance is None:
+                raise Http404
+            self.check_object_permissions(request, instance)
+            return Response(self.get_serializer(instance).data)
+
+        return await self._aconditional_response(queryset, retrieve_object, request, *args, **kwargs)
@@ -0,0 +1,82 @@
+import math
+import random
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from customers.models import Customer, Transaction
+from customers.signals import increment_loyalty_scores
+
+FIRST_NAMES = ['milad', 'mehrdad', 'sara', 'ali', 'maryam', 'reza', 'zahra', 'hossein', 'fatemeh', 'amir',
+               'narges', 'mohammad', 'leila', 'hamid', 'niloofar', 'kaveh', 'shirin', 'babak', 'parisa', 'omid']
+LAST_NAMES = ['mohammadian', 'azad', 'karimi', 'hosseini', 'ahmadi', 'rezaei', 'moradi', 'jafari', 'rahimi',
+              'ebrahimi', 'sadeghi', 'najafi', 'kazemi', 'ghasemi', 'safari', 'bagheri', 'shahbazi', 'zand']
+DESCRIPTIONS = ['Groceries', 'Coffee', 'Online order', 'Restaurant', 'Fuel', 'Pharmacy', 'Books', 'Cinema', '']
+
+ACTIVITY_SKEW = 1.1  # Zipf exponent of transactions per customer, a few customers are very active
+AMOUNT_MU, AMOUNT_SIGMA = 3.5, 1.0  # Log-normal amounts, median about 33
+DATE_MEAN_AGE_DAYS = 120  # Exponentially more transactions in recent months
+DATE_MAX_AGE_DAYS = 730
+
+
+def generate_customers(count, rng, batch_size=5000):
+    """Insert `count` customers with unique emails, returning their ids."""
+    start = Customer.all_objects.count()
+    for offset in range(0, count, batch_size):
+        Customer.objects.bulk_create(
+            Customer(
+                name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                email=f'customer{start + i}@example.com',
+                phone=f'09{rng.randrange(10 ** 9):09d}',
+            )
+            for i in range(offset, min(offset + batch_size, count))
+        )
+    return sorted(Customer.objects.order_by('-id').values_list('id', flat=True)[:count])
+
+
+def generate_transactions(customer_ids, count, rng, batch_size=5000):
+    """Insert `count` transactions spread over `customer_ids` with Zipf activity, returning per-customer counts."""
+    now = timezone.now()
+    weights = [1 / (rank + 1) ** ACTIVITY_SKEW for rank in range(len(customer_ids))]
+    counts = Counter()
+    for offset in range(0, count, batch_size):
+        size = min(batch_size, count - offset)
+        batch = []
+        for customer_id in rng.choices(customer_ids, weights, k=size):
+            amount = max(0.5, math.exp(rng.gauss(AMOUNT_MU, AMOUNT_SIGMA)))
+            age = min(rng.expovariate(1 / DATE_MEAN_AGE_DAYS), DATE_MAX_AGE_DAYS)
+            batch.append(Transaction(
+                customer_id=customer_id,
+                amount=Decimal(f'{amount:.2f}'),
+                description=rng.choice(DESCRIPTIONS),
+                date=now - timedelta(days=age),
+            ))
+            counts[customer_id] += 1
+        Transaction.objects.bulk_create(batch)
+    return counts
+
+
+def generate_dataset(customers, transactions, seed=0):
+    """
+    Insert a synthetic dataset of `customers` and `transactions`.
+
+    Loyalty scores and the daily rollups are brought in line with the inserted
+    transactions, as the signals would have done row by row.
+    """
+    rng = random.Random(seed)
+    with transaction.atomic():
+        customer_ids = generate_customers(customers, rng)
+        counts = generate_transactions(customer_ids, transactions, rng) if customer_ids else Counter()
+        if counts:
+            increment_loyalty_scores(counts)
+    call_command('rebuild_customer_stats', stdout=StringIO())
+    return {
+        'customers': len(customer_ids),
+        'transactions': sum(counts.values()),
+        'busiest_customer_transactions': max(counts.values(), default=0),
+    }
@@ -0,0 +1,279 @@
+import gc
+import json
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+import django
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from elastic_transport import ApiResponseMeta, BaseAsyncNode, BaseNode, HttpHeaders
+from elasticsearch_dsl.connections import connections
+from rest_framework.test import APIClient
+
+from customers.models import Customer
+
+# Settings the suite runs with: a process-local cache and synchronous index flushes
+BENCHMARK_SETTINGS = {
+    'ALLOWED_HOSTS': ['testserver'],
+    'CACHES': {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmarks'},
+    },
+    'ELASTICSEARCH_INDEX_QUEUE': {'ASYNC': False},
+    'LOCAL_DETAIL_CACHE': {'ENABLED': False},
+}
+
+StubResponse = namedtuple('StubResponse', ['meta', 'body'])
+
+
+def _stub_response(config, target, hits):
+    path = target.split('?')[0]
+    if path.endswith('/_search'):
+        data = {
+            'took': 1,
+            'timed_out': False,
+            'hits': {
+                'total': {'value': len(hits), 'relation': 'eq'},
+                'max_score': 1.0,
+                'hits': hits,
+            },
+        }
+    elif path.endswith('/_bulk'):
+        data = {'took': 1, 'errors': False, 'items': []}
+    else:
+        data = {}
+
+    meta = ApiResponseMeta(
+        status=200,
+        http_version='1.1',
+        headers=HttpHeaders({'content-type': 'application/json', 'x-elastic-product': 'Elasticsearch'}),
+        duration=0.0,
+        node=config,
+    )
+    return StubResponse(meta, json.dumps(data).encode())
+
+
+class StubElasticsearchNode(BaseNode):
+    """
+    Transport node answering every request in-process.
+
+    Searches return `hits` as their hits, bulk requests succeed and anything
+    else gets an empty object, so the client, serialization and view code run
+    for real without an Elasticsearch cluster.
+    """
+    hits = []
+
+    def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        return _stub_response(self.config, target, self.hits)
+
+
+class StubAsyncElasticsearchNode(BaseAsyncNode, StubElasticsearchNode):
+    """`StubElasticsearchNode` for the AsyncElasticsearch client of the async views."""
+
+    async def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        return _stub_response(self.config, target, self.hits)
+
+    async def close(self):
+        pass
+
+
+@contextmanager
+def stub_elasticsearch(hits=()):
+    """Route the default elasticsearch-dsl connection and the async clients to the stub nodes."""
+    previous = connections.get_connection()
+    StubElasticsearchNode.hits = list(hits)
+    connections.create_connection('default', hosts=['http://stub:9200'], node_class=StubElasticsearchNode)
+    async_settings = {'default': {'hosts': ['http://stub:9200'], 'node_class': StubAsyncElasticsearchNode}}
+    try:
+        with override_settings(ELASTICSEARCH_DSL=async_settings):
+            yield
+    finally:
+        connections.add_connection('default', previous)
+
+
+class BenchmarkContext:
+    """State shared by the benchmarks: an API client, a seeded rng and the dataset's ids."""
+
+    def __init__(self, seed=0):
+        self.client = APIClient()
+        self.rng = random.Random(seed)
+        self.customer_ids = list(Customer.objects.values_list('id', flat=True))
+        self.created = 0
+
+    def customer_id(self):
+        return self.rng.choice(self.customer_ids)
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name, setup=None):
+    """Register `func(context)` as a benchmark; `setup(context)` runs untimed before each call."""
+    def decorator(func):
+        BENCHMARKS[name] = (func, setup)
+        return func
+    return decorator
+
+
+def _clear_cache(context):
+    cache.clear()
+
+
+def _warm_customer_list(context):
+    context.client.get(reverse('customers-list'), {'limit': 50})
+
+
+@benchmark('customer_list_cold', setup=_clear_cache)
+def customer_list_cold(context):
+    return context.client.get(reverse('customers-list'), {'limit': 50})
+
+
+@benchmark('customer_list_cached', setup=_warm_customer_list)
+def customer_list_cached(context):
+    return context.client.get(reverse('customers-list'), {'limit': 50})
+
+
+@benchmark('customer_retrieve_cold', setup=_clear_cache)
+def customer_retrieve_cold(context):
+    return context.client.get(reverse('customers-detail', args=[context.customer_id()]))
+
+
+@benchmark('customer_retrieve_cached')
+def customer_retrieve_cached(context):
+    # Ids repeat across iterations, so most calls are served from the cache
+    return context.client.get(reverse('customers-detail', args=[context.customer_ids[context.rng.randrange(10)]]))
+
+
+@benchmark('transaction_list_cold', setup=_clear_cache)
+def transaction_list_cold(context):
+    return context.client.get(reverse('transactions-list'), {'limit': 50})
+
+
+@benchmark('transaction_list_keyset', setup=_clear_cache)
+def transaction_list_keyset(context):
+    return context.client.get(reverse('transactions-list'), {'pagination': 'cursor', 'limit': 50})
+
+
+@benchmark('customer_transactions_cold', setup=_clear_cache)
+def customer_transactions_cold(context):
+    return context.client.get(reverse('customer-create-transaction', args=[context.customer_id()]), {'limit': 50})
+
+
+@benchmark('customer_create')
+def customer_create(context):
+    context.created += 1
+    return context.client.post(reverse('customers-list'), {
+        'name': 'benchmark', 'email': f'benchmark{context.created}@example.com', 'phone': '09120000000',
+    })
+
+
+@benchmark('transaction_create')
+def transaction_create(context):
+    # Exercises the loyalty score and daily rollup signals
+    return context.client.post(reverse('customer-create-transaction', args=[context.customer_id()]), {
+        'amount': '25.00', 'description': 'benchmark',
+    })
+
+
+@benchmark('transaction_bulk_100')
+def transaction_bulk(context):
+    items = [
+        {'customer': context.customer_id(), 'amount': '12.50', 'description': 'benchmark'}
+        for _ in range(100)
+    ]
+    return context.client.post(reverse('transactions-bulk'), items, format='json')
+
+
+@benchmark('customer_search')
+def customer_search(context):
+    return context.client.get('/api/customers/search/', {'query': 'milad', 'size': 10})
+
+
+def _search_hits(limit=10):
+    return [
+        {
+            '_index': 'customers', '_id': str(customer['id']), '_score': 1.0, 'sort': [1.0, customer['id']],
+            '_source': customer,
+        }
+        for customer in Customer.objects.values('id', 'name', 'email', 'phone', 'loyalty_score')[:limit]
+    ]
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def measure(func, setup, context, repeat):
+    """Time `repeat` calls of `func`, then count queries and allocations of one more call."""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup(context)
+        gc.collect()
+        started = time.perf_counter()
+        response = func(context)
+        timings.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{func.__name__} returned {response.status_code}: {response.content[:200]!r}')
+
+    if setup:
+        setup(context)
+    with CaptureQueriesContext(connection) as queries:
+        tracemalloc.start()
+        func(context)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        'iterations': repeat,
+        'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+        'p50_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(_percentile(timings, 95) * 1000, 3),
+        'min_ms': round(min(timings) * 1000, 3),
+        'queries': len(queries),
+        'peak_alloc_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(repeat=50, names=None, seed=0, dataset=None):
+    """Run the registered benchmarks against the current database, returning the JSON-ready results."""
+    results = {}
+    with override_settings(**BENCHMARK_SETTINGS), stub_elasticsearch(_search_hits()):
+        cache.clear()
+        context = BenchmarkContext(seed)
+        for name, (func, setup) in BENCHMARKS.items():
+            if names and name not in names:
+                continue
+            results[name] = measure(func, setup, context, repeat)
+        cache.clear()
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'repeat': repeat,
+            'seed': seed,
+            'dataset': dataset or {},
+        },
+        'results': results,
+    }
+
+
+def compare_results(baseline, current, metric='p50_ms'):
+    """Return `(name, baseline, current, change in percent)` for the benchmarks present in both runs."""
+    rows = []
+    for name, result in current['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None or not previous[metric]:
+            continue
+        change = (result[metric] - previous[metric]) / previous[metric] * 100
+        rows.append((name, previous[metric], result[metric], round(change, 1)))
+    return rows
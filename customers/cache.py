@@ -0,0 +1,625 @@
+import asyncio
+import atexit
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+import weakref
+import zlib
+from collections import Counter, OrderedDict
+from urllib.parse import urlencode
+
+import redis.asyncio
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.http import parse_http_date_safe
+from django_redis import get_redis_connection
+from django_redis.cache import RedisCache
+from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .conditional import not_modified_response, set_validators
+from .instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+CACHE_TIMEOUT = 300  # Cache for 5 minutes
+
+LOCAL_CACHE_DEFAULTS = {
+    'ENABLED': False,
+    'MAX_SIZE': 1000,
+    'TIMEOUT': 5,  # Seconds, bounds staleness should an invalidation message be lost
+    'CHANNEL': 'cache-invalidation',
+    'STATS_FLUSH_INTERVAL': 10,  # Seconds local hits are counted in-process before reaching Redis
+}
+
+
+def _generation_key(namespace):
+    return f'{namespace}_generation'
+
+
+def _new_generation():
+    # Seed from the clock so a counter evicted from Redis never reuses an old generation
+    return time.time_ns() // 1000
+
+
+def get_generation(namespace):
+    """Return the current generation counter of a cache namespace."""
+    key = _generation_key(namespace)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, _new_generation(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+async def aget_generation(namespace):
+    key = _generation_key(namespace)
+    generation = await async_cache.get(key)
+    if generation is None:
+        await async_cache.add(key, _new_generation(), timeout=None)
+        generation = await async_cache.get(key)
+    return generation
+
+
+def bump_generation(namespace):
+    """Invalidate every cached list page of a namespace with a single INCR."""
+    key = _generation_key(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        generation = _new_generation()
+        cache.set(key, generation, timeout=None)
+        return generation
+
+
+def reset_generations(namespaces):
+    """
+    Invalidate the cached list pages of several namespaces with one DELETE.
+
+    The next read seeds a new generation from the clock, as after an eviction.
+    """
+    keys = [_generation_key(namespace) for namespace in namespaces]
+    if keys:
+        cache.delete_many(keys)
+
+
+def customer_transactions_namespace(customer_id):
+    """Cache namespace of one customer's transaction list."""
+    return f'customer_{customer_id}_transactions'
+
+
+def _incr_counter(key, delta=1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout=None)
+
+
+def record_hit(namespace):
+    _incr_counter(f'{namespace}_cache_hits')
+
+
+def record_miss(namespace):
+    _incr_counter(f'{namespace}_cache_misses')
+
+
+async def _aincr_counter(key, delta=1):
+    try:
+        await async_cache.incr(key, delta)
+    except ValueError:
+        await async_cache.set(key, delta, timeout=None)
+
+
+async def arecord_hit(namespace):
+    await _aincr_counter(f'{namespace}_cache_hits')
+
+
+async def arecord_miss(namespace):
+    await _aincr_counter(f'{namespace}_cache_misses')
+
+
+class LocalHitCounter:
+    """
+    Hits served by the local tier, counted in-process so they make no Redis
+    call, and added to the shared hit counters every `STATS_FLUSH_INTERVAL`
+    seconds by the hit that finds the interval elapsed.
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._flushed = time.monotonic()
+
+    def add(self, namespace):
+        """Count a hit, returning whether the counts are due for a flush."""
+        with self._lock:
+            self._counts[namespace] += 1
+            return time.monotonic() - self._flushed >= get_local_cache_setting('STATS_FLUSH_INTERVAL')
+
+    def pending(self, namespace):
+        with self._lock:
+            return self._counts[namespace]
+
+    def _take(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._flushed = time.monotonic()
+        return counts
+
+    def flush(self):
+        for namespace, count in self._take().items():
+            _incr_counter(f'{namespace}_cache_hits', count)
+
+    async def aflush(self):
+        for namespace, count in self._take().items():
+            await _aincr_counter(f'{namespace}_cache_hits', count)
+
+
+local_hits = LocalHitCounter()
+atexit.register(local_hits.flush)
+
+
+def record_local_hit(namespace):
+    if local_hits.add(namespace):
+        local_hits.flush()
+
+
+async def arecord_local_hit(namespace):
+    if local_hits.add(namespace):
+        await local_hits.aflush()
+
+
+def get_cache_stats(namespace):
+    """Return the hit/miss counters of a cache namespace, with the local hits this process has not flushed."""
+    hits_key = f'{namespace}_cache_hits'
+    misses_key = f'{namespace}_cache_misses'
+    counters = cache.get_many([hits_key, misses_key])
+    return {
+        'hits': counters.get(hits_key, 0) + local_hits.pending(namespace),
+        'misses': counters.get(misses_key, 0),
+        'generation': get_generation(namespace),
+    }
+
+
+def get_local_cache_setting(name):
+    return getattr(settings, 'LOCAL_DETAIL_CACHE', {}).get(name, LOCAL_CACHE_DEFAULTS[name])
+
+
+def _redis_connection():
+    try:
+        return get_redis_connection('default')
+    except NotImplementedError:
+        # The configured backend is not Redis, e.g. LocMemCache in tests
+        return None
+
+
+class LocalCache:
+    """
+    Size-bounded in-process LRU with a short TTL, in front of the shared cache.
+
+    Keys deleted with `delete_detail_keys` are published on a Redis channel,
+    and a daemon thread in every process drops them from its own tier. The
+    tier is only filled while that thread is subscribed, so no entry can miss
+    its invalidation.
+    """
+    subscribe_timeout = 1.0  # Seconds the first `set` waits for the listener
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener = None
+        self._subscribed = threading.Event()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if time.monotonic() >= expires:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if not self._ensure_listener():
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + get_local_cache_setting('TIMEOUT'))
+            self._entries.move_to_end(key)
+            while len(self._entries) > get_local_cache_setting('MAX_SIZE'):
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def publish(self, keys):
+        connection = _redis_connection()
+        if connection is not None:
+            connection.publish(get_local_cache_setting('CHANNEL'), json.dumps(keys))
+
+    def _ensure_listener(self):
+        """Start the invalidation listener, returning whether it is subscribed."""
+        if self._subscribed.is_set():
+            return True
+        if _redis_connection() is None:
+            # Single process without Redis, nothing to listen to
+            return True
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='local-cache', daemon=True)
+                self._listener.start()
+        return self._subscribed.wait(self.subscribe_timeout)
+
+    def _listen(self):
+        resubscribing = False
+        while True:
+            try:
+                pubsub = _redis_connection().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(get_local_cache_setting('CHANNEL'))
+                if resubscribing:
+                    # Entries cached before the connection dropped may have missed their invalidation
+                    self.clear()
+                self._subscribed.set()
+                for message in pubsub.listen():
+                    self.delete_many(json.loads(message['data']))
+            except Exception:
+                logger.exception('Cache invalidation listener failed, resubscribing')
+                time.sleep(1)
+            self._subscribed.clear()
+            resubscribing = True
+
+
+local_cache = LocalCache()
+
+
+def delete_detail_keys(keys):
+    """Delete detail entries from the shared cache and from the local tier of every process."""
+    keys = list(keys)
+    if not keys:
+        return
+    cache.delete_many(keys)
+    if get_local_cache_setting('ENABLED'):
+        local_cache.delete_many(keys)
+        local_cache.publish(keys)
+
+
+def get_redis_pool_config():
+    """Return the `(url, pool kwargs)` of the default django_redis cache."""
+    config = settings.CACHES['default']
+    location = config['LOCATION']
+    if not isinstance(location, str):
+        location = location[0]
+    options = config.get('OPTIONS', {})
+    kwargs = dict(options.get('CONNECTION_POOL_KWARGS', {}))
+    if 'SOCKET_TIMEOUT' in options:
+        kwargs['socket_timeout'] = options['SOCKET_TIMEOUT']
+    if 'SOCKET_CONNECT_TIMEOUT' in options:
+        kwargs['socket_connect_timeout'] = options['SOCKET_CONNECT_TIMEOUT']
+    return location, kwargs
+
+
+_INCR_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return false
+"""
+
+
+class AsyncCache:
+    """
+    Async access to the default cache for the async views.
+
+    django_redis has no async client, and Django's `a*` cache methods run it
+    in the single thread-sensitive executor. With django_redis this talks to
+    Redis through redis.asyncio instead, one connection pool per event loop,
+    with django_redis' keys and encoding so sync and async views share entries.
+    Other backends fall back to Django's `a*` methods.
+    """
+
+    def __init__(self):
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        if not isinstance(cache, RedisCache):
+            return None
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            location, kwargs = get_redis_pool_config()
+            client = self._clients[loop] = redis.asyncio.Redis.from_url(location, **kwargs)
+        return client
+
+    @staticmethod
+    def _px(timeout):
+        return None if timeout is None else max(1, int(timeout * 1000))
+
+    async def get(self, key, default=None):
+        client = self._client()
+        if client is None:
+            return await cache.aget(key, default)
+        with timed('cache'):
+            value = await client.get(cache.client.make_key(key))
+        return default if value is None else cache.client.decode(value)
+
+    async def set(self, key, value, timeout=CACHE_TIMEOUT):
+        client = self._client()
+        if client is None:
+            return await cache.aset(key, value, timeout)
+        with timed('cache'):
+            await client.set(cache.client.make_key(key), cache.client.encode(value), px=self._px(timeout))
+
+    async def add(self, key, value, timeout=CACHE_TIMEOUT):
+        client = self._client()
+        if client is None:
+            return await cache.aadd(key, value, timeout)
+        with timed('cache'):
+            return bool(await client.set(
+                cache.client.make_key(key), cache.client.encode(value), px=self._px(timeout), nx=True))
+
+    async def delete(self, key):
+        client = self._client()
+        if client is None:
+            return await cache.adelete(key)
+        with timed('cache'):
+            return bool(await client.delete(cache.client.make_key(key)))
+
+    async def incr(self, key, delta=1):
+        client = self._client()
+        if client is None:
+            return await cache.aincr(key, delta)
+        with timed('cache'):
+            value = await client.eval(_INCR_IF_EXISTS, 1, cache.client.make_key(key), delta)
+        if value is None:
+            raise ValueError(f"Key '{key}' not found.")
+        return value
+
+
+async_cache = AsyncCache()
+
+
+def normalize_query(query_params):
+    """Build a canonical query string so equivalent requests share a cache entry."""
+    items = sorted((key, value) for key in query_params for value in query_params.getlist(key))
+    return urlencode(items)
+
+
+class CachedResponseMixin:
+    """
+    Cache list and retrieve responses of a viewset.
+
+    List pages are keyed on the normalized query string (filters, limit, offset)
+    and on the namespace generation, so bumping the generation invalidates all
+    pages at once. Detail entries are keyed on `cache_detail_key`.
+
+    Entries are kept `cache_stale_timeout` seconds past their jittered expiry.
+    Only the request holding the recompute lock rebuilds an expired entry, and
+    the others keep serving the stale copy. With `cache_early_refresh_beta` set,
+    entries are refreshed early with a probability that grows near their expiry
+    and with how long they took to compute.
+
+    With `LOCAL_DETAIL_CACHE['ENABLED']`, retrieve also goes through the
+    in-process `local_cache` tier unless `cache_local_tier` is False.
+
+    With `cache_rendered`, JSON responses are cached as their rendered bytes,
+    zlib-compressed above `cache_compress_min_size`, together with an ETag.
+    Hits are served without unpickling or re-rendering the data. The ETag and
+    Last-Modified of every entry are replayed on hits, and a request whose
+    conditional headers match them gets an empty 304.
+    """
+    cache_namespace = None
+    cache_detail_key = None
+    cache_timeout = CACHE_TIMEOUT
+    cache_stale_timeout = 60
+    cache_jitter = 0.1  # Spread expiries by +/-10% so entries do not expire together
+    cache_early_refresh_beta = 1.0  # 0 disables probabilistic early refresh
+    cache_lock_timeout = 10
+    cache_lock_wait = 0.5  # Seconds a cold miss waits for another request's recompute
+    cache_local_tier = True
+    cache_rendered = False
+    cache_compress_min_size = 1024  # Bytes, None disables compression
+
+    def get_list_cache_key(self, request):
+        generation = get_generation(self.cache_namespace)
+        query = normalize_query(request.query_params)
+        digest = hashlib.md5(query.encode()).hexdigest()
+        return f'{self.cache_namespace}_list_{generation}_{digest}'
+
+    async def aget_list_cache_key(self, request):
+        generation = await aget_generation(self.cache_namespace)
+        query = normalize_query(request.query_params)
+        digest = hashlib.md5(query.encode()).hexdigest()
+        return f'{self.cache_namespace}_list_{generation}_{digest}'
+
+    def get_detail_cache_key(self, pk):
+        return self.cache_detail_key.format(pk=pk)
+
+    def get_validator_version(self):
+        # Writes to the rows bump the namespace generation
+        return get_generation(self.cache_namespace)
+
+    async def aget_validator_version(self):
+        return await aget_generation(self.cache_namespace)
+
+    def invalidate_list_cache(self):
+        bump_generation(self.cache_namespace)
+
+    def invalidate_detail_cache(self, pk):
+        delete_detail_keys([self.get_detail_cache_key(pk)])
+
+    def _needs_refresh(self, entry):
+        now = time.time()
+        if now >= entry['expires']:
+            return True
+        if not self.cache_early_refresh_beta:
+            return False
+        # XFetch: -log(u) is exponentially distributed, scaled by the recompute time
+        jump = -entry['delta'] * self.cache_early_refresh_beta * math.log(1 - random.random())
+        return now + jump >= entry['expires']
+
+    def _wait_for_entry(self, cache_key):
+        deadline = time.monotonic() + self.cache_lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(cache_key)
+            if entry is not None:
+                return entry
+        return None
+
+    async def _await_entry(self, cache_key):
+        deadline = time.monotonic() + self.cache_lock_wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            entry = await async_cache.get(cache_key)
+            if entry is not None:
+                return entry
+        return None
+
+    def _make_entry(self, request, response):
+        # Validators set by the view, e.g. by ConditionalRequestMixin, are kept with the entry
+        entry = {
+            'etag': response.get('ETag'),
+            'last_modified': parse_http_date_safe(response.get('Last-Modified')),
+        }
+        if not (self.cache_rendered and isinstance(request.accepted_renderer, JSONRenderer)):
+            entry['data'] = response.data
+            return entry
+
+        content = request.accepted_renderer.render(response.data, request.accepted_media_type)
+        if entry['etag'] is None:
+            entry['etag'] = response['ETag'] = f'"{hashlib.md5(content).hexdigest()}"'
+        compressed = self.cache_compress_min_size is not None and len(content) >= self.cache_compress_min_size
+        entry.update(content=zlib.compress(content) if compressed else content, compressed=compressed)
+        return entry
+
+    def _entry_response(self, request, entry):
+        response = not_modified_response(request, entry['etag'], entry['last_modified'])
+        if response is not None:
+            return response
+
+        if 'data' in entry:
+            response = Response(entry['data'])
+        else:
+            content = zlib.decompress(entry['content']) if entry['compressed'] else entry['content']
+            if isinstance(request.accepted_renderer, JSONRenderer):
+                response = HttpResponse(content, content_type='application/json')
+            else:
+                # e.g. the browsable API, render the data again
+                response = Response(json.loads(content))
+        return set_validators(response, entry['etag'], entry['last_modified'])
+
+    def _stamp_entry(self, entry, delta):
+        fresh = self.cache_timeout * random.uniform(1 - self.cache_jitter, 1 + self.cache_jitter)
+        entry.update(expires=time.time() + fresh, delta=delta)
+        return fresh + self.cache_stale_timeout
+
+    def _store_entry(self, cache_key, entry, delta, local=False):
+        cache.set(cache_key, entry, timeout=self._stamp_entry(entry, delta))
+        if local:
+            local_cache.set(cache_key, entry)
+
+    def _cached_response(self, cache_key, view, request, *args, local=False, **kwargs):
+        if local:
+            entry = local_cache.get(cache_key)
+            if entry is not None and not self._needs_refresh(entry):
+                record_local_hit(self.cache_namespace)
+                return self._entry_response(request, entry)
+
+        entry = cache.get(cache_key)
+        if entry is not None and not self._needs_refresh(entry):
+            if local:
+                local_cache.set(cache_key, entry)
+            record_hit(self.cache_namespace)
+            return self._entry_response(request, entry)
+
+        lock_key = f'{cache_key}_lock'
+        locked = cache.add(lock_key, 1, timeout=self.cache_lock_timeout)
+        if not locked:
+            # Another request is recomputing, serve what it has or will have
+            entry = entry or self._wait_for_entry(cache_key)
+            if entry is not None:
+                record_hit(self.cache_namespace)
+                return self._entry_response(request, entry)
+
+        record_miss(self.cache_namespace)
+        try:
+            started = time.monotonic()
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                entry = self._make_entry(request, response)
+                self._store_entry(cache_key, entry, time.monotonic() - started, local)
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+        return response
+
+    async def _acached_response(self, cache_key, view, request, *args, local=False, **kwargs):
+        """Async `_cached_response` for the async views, `view` is a coroutine function."""
+        if local:
+            entry = local_cache.get(cache_key)
+            if entry is not None and not self._needs_refresh(entry):
+                await arecord_local_hit(self.cache_namespace)
+                return self._entry_response(request, entry)
+
+        entry = await async_cache.get(cache_key)
+        if entry is not None and not self._needs_refresh(entry):
+            if local:
+                local_cache.set(cache_key, entry)
+            await arecord_hit(self.cache_namespace)
+            return self._entry_response(request, entry)
+
+        lock_key = f'{cache_key}_lock'
+        locked = await async_cache.add(lock_key, 1, timeout=self.cache_lock_timeout)
+        if not locked:
+            entry = entry or await self._await_entry(cache_key)
+            if entry is not None:
+                await arecord_hit(self.cache_namespace)
+                return self._entry_response(request, entry)
+
+        await arecord_miss(self.cache_namespace)
+        try:
+            started = time.monotonic()
+            response = await view(request, *args, **kwargs)
+            if response.status_code == 200:
+                entry = self._make_entry(request, response)
+                timeout = self._stamp_entry(entry, time.monotonic() - started)
+                await async_cache.set(cache_key, entry, timeout=timeout)
+                if local:
+                    local_cache.set(cache_key, entry)
+        finally:
+            if locked:
+                await async_cache.delete(lock_key)
+
+        return response
+
+    def list(self, request, *args, **kwargs):
+        cache_key = self.get_list_cache_key(request)
+        return self._cached_response(cache_key, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        cache_key = self.get_detail_cache_key(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        local = self.cache_local_tier and get_local_cache_setting('ENABLED')
+        return self._cached_response(cache_key, super().retrieve, request, *args, local=local, **kwargs)
+
+    @action(detail=False, methods=['get'], url_path='cache-stats')
+    def cache_stats(self, request):
+        return Response(get_cache_stats(self.cache_namespace))
@@ -0,0 +1,106 @@
+import logging
+
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+from django.utils.module_loading import import_string
+from django_redis.cache import RedisCache
+
+from .instrumentation import get_timing_setting
+
+logger = logging.getLogger(__name__)
+
+
+def connection_pool_report():
+    """Return the effective connection reuse settings of the database, Redis and Elasticsearch."""
+    database = settings.DATABASES['default']
+    cache_options = settings.CACHES['default'].get('OPTIONS', {})
+    pool = cache_options.get('CONNECTION_POOL_KWARGS', {})
+    elasticsearch = settings.ELASTICSEARCH_DSL['default']
+    hosts = elasticsearch.get('hosts', [])
+    return {
+        'database': {
+            'conn_max_age': database.get('CONN_MAX_AGE', 0),
+            'health_checks': database.get('CONN_HEALTH_CHECKS', False),
+        },
+        'redis': {
+            'max_connections': pool.get('max_connections'),  # None is unbounded
+            'socket_timeout': cache_options.get('SOCKET_TIMEOUT'),
+            'socket_connect_timeout': cache_options.get('SOCKET_CONNECT_TIMEOUT'),
+        },
+        'elasticsearch': {
+            'nodes': 1 if isinstance(hosts, str) else len(hosts),
+            # Defaults of the elasticsearch client
+            'connections_per_node': elasticsearch.get('connections_per_node', 10),
+            'max_retries': elasticsearch.get('max_retries', 3),
+            'sniffing': bool(elasticsearch.get('sniff_on_start') or elasticsearch.get('sniff_on_node_failure')),
+        },
+    }
+
+
+def log_connection_pools():
+    report = connection_pool_report()
+    logger.info(
+        'Connection pools: database conn_max_age=%s health_checks=%s; '
+        'redis max_connections=%s socket_timeout=%s; '
+        'elasticsearch nodes=%s connections_per_node=%s max_retries=%s sniffing=%s',
+        report['database']['conn_max_age'], report['database']['health_checks'],
+        report['redis']['max_connections'], report['redis']['socket_timeout'],
+        *report['elasticsearch'].values(),
+    )
+
+
+def _uses_redis():
+    return issubclass(import_string(settings.CACHES['default']['BACKEND']), RedisCache)
+
+
+@register()
+def check_connection_pools(app_configs, **kwargs):
+    report = connection_pool_report()
+    messages = []
+
+    conn_max_age = report['database']['conn_max_age']
+    if conn_max_age != 0 and not report['database']['health_checks']:
+        messages.append(Warning(
+            'Persistent database connections are reused without health checks.',
+            hint='Set CONN_HEALTH_CHECKS to True so broken connections are replaced before use.',
+            id='customers.W001',
+        ))
+    if conn_max_age != 0 and settings.ASYNC_VIEWS:
+        messages.append(Warning(
+            'CONN_MAX_AGE has no effect under ASGI, connections are not reused across requests.',
+            hint='Set CONN_MAX_AGE to 0 and pool connections with a pooler such as PgBouncer.',
+            id='customers.W002',
+        ))
+
+    max_connections = report['redis']['max_connections']
+    if max_connections is not None and max_connections < 1:
+        messages.append(Error('Redis max_connections must be at least 1.', id='customers.E001'))
+    if report['elasticsearch']['connections_per_node'] < 1:
+        messages.append(Error('Elasticsearch connections_per_node must be at least 1.', id='customers.E002'))
+    return messages
+
+
+@register()
+def check_request_timing(app_configs, **kwargs):
+    if not 0 <= get_timing_setting('SAMPLE_RATE') <= 1:
+        return [Error("REQUEST_TIMING['SAMPLE_RATE'] must be between 0 and 1.", id='customers.E003')]
+    return []
+
+
+@register(deploy=True)
+def check_connection_pools_deploy(app_configs, **kwargs):
+    report = connection_pool_report()
+    messages = []
+    if _uses_redis() and report['redis']['max_connections'] is None:
+        messages.append(Warning(
+            'The Redis connection pool is unbounded.',
+            hint="Set CONNECTION_POOL_KWARGS['max_connections'] in the cache OPTIONS.",
+            id='customers.W003',
+        ))
+    if _uses_redis() and report['redis']['socket_timeout'] is None:
+        messages.append(Warning(
+            'Redis calls have no socket timeout, a stalled server blocks workers indefinitely.',
+            hint='Set SOCKET_TIMEOUT and SOCKET_CONNECT_TIMEOUT in the cache OPTIONS.',
+            id='customers.W004',
+        ))
+    return messages
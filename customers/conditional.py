@@ -0,0 +1,176 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .pagination import KeysetPagination, LimitOffsetCountPagination
+
+
+def set_validators(response, etag=None, last_modified=None):
+    """Set the ETag and Last-Modified (a timestamp) headers on `response`."""
+    if etag:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def not_modified_response(request, etag=None, last_modified=None):
+    """Return a 304 if the conditional headers of `request` match the validators, else None."""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+class ConditionalRequestMixin:
+    """
+    Emit ETag and Last-Modified on list and retrieve, and answer 304 early.
+
+    The validators come from one query over the rows the response would
+    contain. `If-None-Match`/`If-Modified-Since` are checked against them
+    before the page is fetched or serialized.
+
+    Retrieve and lists with an exact count aggregate the count, highest id and
+    latest `last_modified_field` of the rows, and the count is handed to the
+    paginator so it does not run its own COUNT(*). On such lists a
+    `last_modified_field` across a relation would join the whole table, so
+    `get_validator_version()`, e.g. the cache generation every write bumps,
+    stands in for it. Keyset pages and the
+    `count=none`/`count=approximate` modes never count: their validators are
+    the ids of the page, plus the first row of the next one, and their latest
+    `last_modified_field`, read from the page's index range.
+    """
+    last_modified_field = None
+
+    def aggregates_last_modified(self):
+        return bool(self.last_modified_field) and (
+            self.action != 'list' or LOOKUP_SEP not in self.last_modified_field
+        )
+
+    def get_validator_aggregates(self):
+        aggregates = {'count': Count('pk'), 'max_pk': Max('pk')}
+        if self.aggregates_last_modified():
+            aggregates['last_modified'] = Max(self.last_modified_field)
+        return aggregates
+
+    def get_validator_version(self):
+        """A value that changes with every write to the rows, used when `last_modified_field` is not aggregated."""
+        return None
+
+    async def aget_validator_version(self):
+        return self.get_validator_version()
+
+    def get_validator_page(self, queryset):
+        """
+        The rows of the requested page and the first of the next one, or None
+        when the list is validated with an exact count.
+        """
+        paginator = self.paginator
+        if isinstance(paginator, KeysetPagination):
+            return paginator.get_page_queryset(queryset, self.request)
+        if not isinstance(paginator, LimitOffsetCountPagination) or paginator.get_count_mode(self.request) == 'exact':
+            return None
+        limit = paginator.get_limit(self.request)
+        if limit is None:
+            return None
+        offset = paginator.get_offset(self.request)
+        return queryset[offset:offset + limit + 1]
+
+    def get_page_fields(self):
+        return ['pk', self.last_modified_field] if self.last_modified_field else ['pk']
+
+    @staticmethod
+    def page_values(rows):
+        """Validator values of a page from its `(pk, last modified)` rows."""
+        timestamps = [row[1] for row in rows if len(row) > 1 and row[1] is not None]
+        return {
+            'count': None,
+            'page': [row[0] for row in rows],
+            'last_modified': max(timestamps) if timestamps else None,
+        }
+
+    def build_validators(self, values):
+        """Return `(count, etag, last_modified)` from the aggregated or page values."""
+        last_modified = values.get('last_modified')
+        fingerprint = ':'.join([
+            self.action,
+            self.request.accepted_renderer.format,
+            str(sorted(self.request.query_params.lists())),
+            str(values['count']),
+            str(values.get('max_pk')),
+            str(values.get('version')),
+            ','.join(map(str, values.get('page', []))),
+            last_modified.isoformat() if last_modified else '',
+        ])
+        etag = f'"{hashlib.md5(fingerprint.encode()).hexdigest()}"'
+        return values['count'], etag, int(last_modified.timestamp()) if last_modified else None
+
+    def get_validators(self, queryset):
+        if self.action == 'list':
+            page = self.get_validator_page(queryset)
+            if page is not None:
+                return self.build_validators(self.page_values(list(page.values_list(*self.get_page_fields()))))
+        values = queryset.aggregate(**self.get_validator_aggregates())
+        if self.last_modified_field and not self.aggregates_last_modified():
+            values['version'] = self.get_validator_version()
+        return self.build_validators(values)
+
+    async def aget_validators(self, queryset):
+        if self.action == 'list':
+            page = self.get_validator_page(queryset)
+            if page is not None:
+                rows = [row async for row in page.values_list(*self.get_page_fields())]
+                return self.build_validators(self.page_values(rows))
+        values = await queryset.aaggregate(**self.get_validator_aggregates())
+        if self.last_modified_field and not self.aggregates_last_modified():
+            values['version'] = await self.aget_validator_version()
+        return self.build_validators(values)
+
+    def get_lookup_queryset(self, queryset):
+        """Filter `queryset` down to the object retrieve would return, or None for an invalid lookup."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            return queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, ValidationError):
+            return None
+
+    def _conditional_response(self, queryset, view, request, *args, **kwargs):
+        count, etag, last_modified = self.get_validators(queryset)
+        # A missing row is left to the view, which answers 404
+        if count or self.action == 'list':
+            response = not_modified_response(request, etag, last_modified)
+            if response is not None:
+                return response
+
+        self.validated_count = count
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_validators(response, etag, last_modified)
+        return response
+
+    async def _aconditional_response(self, queryset, view, request, *args, **kwargs):
+        count, etag, last_modified = await self.aget_validators(queryset)
+        if count or self.action == 'list':
+            response = not_modified_response(request, etag, last_modified)
+            if response is not None:
+                return response
+
+        self.validated_count = count
+        response = await view(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_validators(response, etag, last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self._conditional_response(queryset, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        queryset = self.get_lookup_queryset(self.filter_queryset(self.get_queryset()))
+        if queryset is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self._conditional_response(queryset, super().retrieve, request, *args, **kwargs)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django_elasticsearch_dsl import Document, fields
 from django_elasticsearch_dsl.registries import registry
 from .models import (
@@ -5,6 +6,10 @@ from .models import (
     Transaction)
 
 
+def autosync_enabled():
+    return getattr(settings, 'ELASTICSEARCH_DSL_AUTOSYNC', True)
+
+
 @registry.register_document
 class CustomerDocument(Document):
     name = fields.TextField(
@@ -19,6 +24,9 @@ class CustomerDocument(Document):
         }
     )
 
+    # Typeahead on name, email and phone prefixes
+    suggest = fields.CompletionField()
+
     class Index:
         name = 'customers'
         settings = {'number_of_shards': 1, 'number_of_replicas': 0}
@@ -34,6 +42,13 @@ class CustomerDocument(Document):
             'deleted_at',
         ]
 
+    def prepare_suggest(self, instance):
+        # Soft-deleted customers get no inputs, so they never show up as suggestions
+        if instance.deleted_at is not None:
+            return {'input': []}
+        inputs = [instance.name, *instance.name.split(), instance.email, instance.phone]
+        return {'input': list(dict.fromkeys(value for value in inputs if value))}
+
 
 @registry.register_document
 class TransactionDocument(Document):
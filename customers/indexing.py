@@ -0,0 +1,203 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django_elasticsearch_dsl.registries import registry
+from django_elasticsearch_dsl.signals import RealTimeSignalProcessor
+from elasticsearch import ConnectionError as ElasticsearchConnectionError, ConnectionTimeout
+from elasticsearch.helpers import bulk
+
+from .documents import autosync_enabled
+
+logger = logging.getLogger(__name__)
+
+# Failures that are not the rows' fault, they are retried without counting
+UNAVAILABLE_ERRORS = (ConnectionError, ElasticsearchConnectionError, ConnectionTimeout)
+
+INDEX_QUEUE_DEFAULTS = {
+    'ASYNC': True,  # False flushes synchronously after each commit, e.g. for tests
+    'BATCH_SIZE': 500,
+    'MAX_LAG': 1.0,  # Seconds a change may wait before it is flushed
+    'MAX_RETRIES': 5,  # Failed flushes of a row before its change is dropped
+}
+
+
+def get_queue_setting(name):
+    return getattr(settings, 'ELASTICSEARCH_INDEX_QUEUE', {}).get(name, INDEX_QUEUE_DEFAULTS[name])
+
+
+class IndexQueue:
+    """
+    Deduplicating queue of (model, pk) index changes flushed in `_bulk` batches.
+
+    Several saves of the same row between two flushes become one index action,
+    and the latest action wins. Updates of the documents that embed a row,
+    the `related` action, are queued apart from the row's own action. A daemon
+    thread flushes the queue every `MAX_LAG` seconds or as soon as
+    `BATCH_SIZE` changes are pending. Batches that fail while Elasticsearch
+    is unreachable are put back as they are. When a batch fails otherwise its
+    rows are retried one by one, so a single bad row does not hold back the
+    others, and the rows that still fail are put back. A row whose change
+    failed `MAX_RETRIES` flushes is dropped and logged, `reindex_search`
+    repairs it.
+    `stop` ends the thread after a last flush, it runs at interpreter exit.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._retries = defaultdict(int)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._worker = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, model, pks, action='index'):
+        with self._lock:
+            for pk in pks:
+                self._pending[self._key(model, pk, action)] = action
+            full = len(self._pending) >= get_queue_setting('BATCH_SIZE')
+
+        if not get_queue_setting('ASYNC'):
+            self.flush()
+            return
+        self._ensure_worker()
+        if full:
+            self._wakeup.set()
+
+    def put_on_commit(self, model, pks, action='index'):
+        pks = list(pks)
+        transaction.on_commit(lambda: self.put(model, pks, action))
+
+    @staticmethod
+    def _key(model, pk, action):
+        return model, pk, action == 'related'
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        batches = defaultdict(list)
+        for (model, pk, _), action in pending.items():
+            batches[model, action].append(pk)
+
+        for (model, action), pks in batches.items():
+            try:
+                self._send(model, action, pks)
+            except UNAVAILABLE_ERRORS:
+                logger.exception('Indexing %d %s rows failed, requeueing', len(pks), model.__name__)
+                self._requeue(model, action, pks, pks, count=False)
+                continue
+            except Exception:
+                logger.exception('Indexing %d %s rows failed, retrying them one by one', len(pks), model.__name__)
+                failed = self._send_each(model, action, pks) if len(pks) > 1 else pks
+            else:
+                failed = []
+            self._requeue(model, action, pks, failed)
+
+    def _send_each(self, model, action, pks):
+        failed = []
+        for pk in pks:
+            try:
+                self._send(model, action, [pk])
+            except Exception:
+                failed.append(pk)
+        return failed
+
+    def _requeue(self, model, action, pks, failed, count=True):
+        dropped = []
+        with self._lock:
+            for pk in set(pks) - set(failed):
+                self._retries.pop(self._key(model, pk, action), None)
+            for pk in failed:
+                key = self._key(model, pk, action)
+                if count:
+                    self._retries[key] += 1
+                if self._retries[key] > get_queue_setting('MAX_RETRIES'):
+                    del self._retries[key]
+                    dropped.append(pk)
+                else:
+                    # Keep any newer change queued meanwhile
+                    self._pending.setdefault(key, action)
+        if dropped:
+            logger.error('Dropped the %s of %s rows %s after %d retries',
+                         action, model.__name__, dropped, get_queue_setting('MAX_RETRIES'))
+
+    def _send(self, model, action, pks):
+        if not autosync_enabled():
+            return
+        if action == 'related':
+            for instance in model._base_manager.filter(pk__in=pks):
+                registry.update_related(instance)
+            return
+        documents = [doc for doc in registry.get_documents([model]) if not doc.django.ignore_signals]
+        if action == 'index':
+            instances = list(model._base_manager.filter(pk__in=pks).select_related())
+            for document in documents:
+                document().update(instances)
+            # Rows gone from the database are removed from the index
+            pks = set(pks) - {instance.pk for instance in instances}
+        if not pks:
+            return
+        for document in documents:
+            actions = ({'_op_type': 'delete', '_index': document._index._name, '_id': pk} for pk in pks)
+            bulk(document._get_connection(), actions, raise_on_error=False)
+
+    def stop(self, timeout=5.0):
+        """Stop the worker thread, then flush what is still pending."""
+        self._stopping.set()
+        self._wakeup.set()
+        worker = self._worker
+        if worker is not None and worker is not threading.current_thread():
+            worker.join(timeout)
+        self._worker = None
+        self.flush()
+        self._stopping.clear()
+
+    def _ensure_worker(self):
+        if self._stopping.is_set() or (self._worker is not None and self._worker.is_alive()):
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='index-queue', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(get_queue_setting('MAX_LAG'))
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            self.flush()
+            close_old_connections()
+        close_old_connections()
+
+
+index_queue = IndexQueue()
+atexit.register(index_queue.stop)
+
+
+class QueuedSignalProcessor(RealTimeSignalProcessor):
+    """
+    Signal processor that hands saves and deletes to `index_queue` once committed.
+
+    Deletes of related rows still update the documents embedding them
+    synchronously, in pre_delete, while the row can be read.
+    """
+
+    def handle_save(self, sender, instance, **kwargs):
+        if sender in registry:
+            index_queue.put_on_commit(sender, [instance.pk])
+        if sender in registry._related_models:
+            index_queue.put_on_commit(sender, [instance.pk], action='related')
+
+    def handle_delete(self, sender, instance, **kwargs):
+        if sender in registry:
+            index_queue.put_on_commit(sender, [instance.pk], action='delete')
@@ -0,0 +1,299 @@
+import random
+import threading
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from django_redis.client import DefaultClient
+from elastic_transport import AiohttpHttpNode, Urllib3HttpNode
+from elasticsearch_dsl.connections import connections
+
+from .slowlog import record_slow_search
+
+REQUEST_TIMING_DEFAULTS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0,  # Fraction of requests timed, the others pay no instrumentation cost
+    'SERVER_TIMING': True,  # Send the breakdown of sampled requests as a Server-Timing header
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+}
+
+CATEGORIES = ('db', 'cache', 'es')
+
+_current = ContextVar('request_timings', default=None)
+_active = ContextVar('request_timing_category', default=None)
+
+
+def get_timing_setting(name):
+    return getattr(settings, 'REQUEST_TIMING', {}).get(name, REQUEST_TIMING_DEFAULTS[name])
+
+
+class RequestTimings:
+    """Call counts and durations by category of one request, shared with the threads serving it."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.durations = dict.fromkeys(CATEGORIES, 0.0)
+        self.counts = dict.fromkeys(CATEGORIES, 0)
+        self._lock = threading.Lock()
+
+    def add(self, category, duration):
+        with self._lock:
+            self.durations[category] += duration
+            self.counts[category] += 1
+
+    def server_timing(self, total):
+        metrics = [
+            f'{category};dur={self.durations[category] * 1000:.2f};desc="{self.counts[category]} calls"'
+            for category in CATEGORIES if self.counts[category]
+        ]
+        app = max(0.0, total - sum(self.durations.values()))
+        metrics.append(f'app;dur={app * 1000:.2f}')
+        metrics.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(metrics)
+
+
+class Timer:
+    """
+    Add the duration of the block to `category` of the current request.
+
+    A no-op outside sampled requests, and inside another block of the same
+    category so calls made by other instrumented calls are counted once.
+    """
+    __slots__ = ('category', 'timings', 'token', 'started')
+
+    def __init__(self, category):
+        self.category = category
+
+    def __enter__(self):
+        self.timings = _current.get()
+        if self.timings is not None and _active.get() != self.category:
+            self.token = _active.set(self.category)
+            self.started = perf_counter()
+        else:
+            self.timings = None
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.add(self.category, perf_counter() - self.started)
+            _active.reset(self.token)
+
+
+def timed(category):
+    return Timer(category)
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """`connection_created` receiver timing the queries of every database connection."""
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
+
+
+def _timed_method(method):
+    def wrapper(self, *args, **kwargs):
+        with timed('cache'):
+            return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+class TimedRedisClient(DefaultClient):
+    """django_redis client timing its commands, set as the cache's CLIENT_CLASS."""
+
+
+for _name in ('get', 'set', 'add', 'delete', 'delete_many', 'get_many', 'set_many', 'incr', 'decr',
+              'has_key', 'touch', 'ttl', 'expire', 'persist', 'keys', 'delete_pattern', 'clear'):
+    setattr(TimedRedisClient, _name, _timed_method(getattr(DefaultClient, _name)))
+
+
+class TimedUrllib3HttpNode(Urllib3HttpNode):
+    """Transport node timing its requests and logging slow searches."""
+
+    def perform_request(self, method, target, body=None, *args, **kwargs):
+        started = perf_counter()
+        with timed('es'):
+            response = super().perform_request(method, target, body, *args, **kwargs)
+        record_slow_search(target, body, response.body, perf_counter() - started)
+        return response
+
+
+class TimedAiohttpHttpNode(AiohttpHttpNode):
+    """`TimedUrllib3HttpNode` for the AsyncElasticsearch client."""
+
+    async def perform_request(self, method, target, body=None, *args, **kwargs):
+        started = perf_counter()
+        with timed('es'):
+            response = await super().perform_request(method, target, body, *args, **kwargs)
+        record_slow_search(target, body, response.body, perf_counter() - started)
+        return response
+
+
+def instrument_elasticsearch():
+    """Reconfigure the elasticsearch-dsl connections to time their requests, unless they set a node class."""
+    connections.configure(**{
+        alias: {'node_class': TimedUrllib3HttpNode, **config}
+        for alias, config in settings.ELASTICSEARCH_DSL.items()
+    })
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels):
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return ','.join(f'{name}="{value}"' for name, value in escaped)
+
+
+class TimingRegistry:
+    """Per-process aggregate of the sampled requests, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._backends = {}
+        self._calls = Counter()
+
+    def _histogram(self, histograms, key):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(get_timing_setting('BUCKETS'))
+        return histogram
+
+    def observe(self, view, method, timings, total):
+        with self._lock:
+            self._histogram(self._requests, (view, method)).observe(total)
+            for category in CATEGORIES:
+                self._histogram(self._backends, (view, method, category)).observe(timings.durations[category])
+                self._calls[(view, method, category)] += timings.counts[category]
+
+    def clear(self):
+        with self._lock:
+            self._requests.clear()
+            self._backends.clear()
+            self._calls.clear()
+
+    @staticmethod
+    def _render_histogram(lines, name, labels, histogram):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+        lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+    def render(self):
+        with self._lock:
+            lines = [
+                '# HELP customers_request_duration_seconds Time spent handling sampled requests.',
+                '# TYPE customers_request_duration_seconds histogram',
+            ]
+            for (view, method), histogram in sorted(self._requests.items()):
+                self._render_histogram(lines, 'customers_request_duration_seconds',
+                                       _labels(view=view, method=method), histogram)
+
+            lines += [
+                '# HELP customers_backend_duration_seconds Time a sampled request spent in each backend.',
+                '# TYPE customers_backend_duration_seconds histogram',
+            ]
+            for (view, method, backend), histogram in sorted(self._backends.items()):
+                self._render_histogram(lines, 'customers_backend_duration_seconds',
+                                       _labels(view=view, method=method, backend=backend), histogram)
+
+            lines += [
+                '# HELP customers_backend_calls_total Backend calls made by sampled requests.',
+                '# TYPE customers_backend_calls_total counter',
+            ]
+            for (view, method, backend), count in sorted(self._calls.items()):
+                lines.append(f'customers_backend_calls_total{{{_labels(view=view, method=method, backend=backend)}}} '
+                             f'{count}')
+        return '\n'.join(lines) + '\n'
+
+
+timing_registry = TimingRegistry()
+
+
+class RequestTimingMiddleware:
+    """
+    Time a sample of the requests by category: database, cache and Elasticsearch.
+
+    The remainder, DRF parsing, serialization and rendering, is reported as
+    `app`. Sampled responses get a Server-Timing header and are aggregated per
+    view in `timing_registry`, served by the `metrics` view. Work done while a
+    streaming response is consumed is not included.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _sample():
+        if not get_timing_setting('ENABLED'):
+            return None
+        if random.random() >= get_timing_setting('SAMPLE_RATE'):
+            return None
+        return RequestTimings()
+
+    @staticmethod
+    def _finish(request, response, timings):
+        total = perf_counter() - timings.started
+        match = request.resolver_match
+        timing_registry.observe(match.view_name if match else 'unmatched', request.method, timings, total)
+        if get_timing_setting('SERVER_TIMING'):
+            response['Server-Timing'] = timings.server_timing(total)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = self._sample()
+        if timings is None:
+            return self.get_response(request)
+        token = _current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = self._sample()
+        if timings is None:
+            return await self.get_response(request)
+        token = _current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings)
+
+
+def metrics(request):
+    """The aggregated request timings of this process in the Prometheus text format."""
+    return HttpResponse(timing_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,60 @@
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from customers.cache import (
+    bump_generation, customer_transactions_namespace, delete_detail_keys, reset_generations)
+from customers.indexing import index_queue
+from customers.models import ArchivedTransaction, Transaction
+
+ARCHIVED_FIELDS = ['id', 'customer_id', 'amount', 'description', 'date', 'deleted_at']
+
+
+class Command(BaseCommand):
+    help = ('Move soft-deleted transactions and transactions older than N months into the archive '
+            'table in chunked batches, removing them from the transactions index. Meant to run from cron.')
+
+    def add_arguments(self, parser):
+        archive_settings = getattr(settings, 'TRANSACTION_ARCHIVE', {})
+        parser.add_argument('--months', type=int, default=archive_settings.get('AFTER_MONTHS', 24),
+                            help='Archive transactions older than this many months, 0 keeps them all.')
+        parser.add_argument('--batch-size', type=int, default=archive_settings.get('BATCH_SIZE', 1000))
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would move.')
+
+    def handle(self, *args, **options):
+        condition = Q(deleted_at__isnull=False)
+        if options['months']:
+            cutoff = timezone.now() - relativedelta(months=options['months'])
+            condition |= Q(date__lt=cutoff)
+        candidates = Transaction.all_objects.filter(condition)
+
+        if options['dry_run']:
+            self.stdout.write(f'{candidates.count()} transactions would be archived.')
+            return
+
+        archived, last_pk = 0, 0
+        customer_ids = set()
+        while True:
+            # Walk the candidates in primary key order, one batch per transaction
+            pks = list(candidates.filter(pk__gt=last_pk).order_by('pk')
+                       .values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            with transaction.atomic():
+                rows = list(Transaction.all_objects.filter(pk__in=pks).values(*ARCHIVED_FIELDS))
+                ArchivedTransaction.objects.bulk_create(
+                    [ArchivedTransaction(**row) for row in rows], ignore_conflicts=True)
+                # Deleting queues the removal of the documents from the transactions index
+                Transaction.all_objects.filter(pk__in=pks).hard_delete()
+            delete_detail_keys(f'transaction_{pk}' for pk in pks)
+            customer_ids.update(row['customer_id'] for row in rows)
+            archived += len(pks)
+            last_pk = pks[-1]
+
+        if archived:
+            bump_generation('transactions')
+            reset_generations(customer_transactions_namespace(customer_id) for customer_id in customer_ids)
+        index_queue.flush()
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} transactions.'))
@@ -0,0 +1,67 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from customers.benchmarks.data import generate_dataset
+from customers.benchmarks.suite import BENCHMARKS, compare_results, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Run the API micro-benchmarks against a throwaway database filled with synthetic data '
+            'and report latency, query counts and allocations, optionally as JSON to diff between releases.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--transactions', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=50, help='Timed iterations per benchmark.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='Only run these benchmarks.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', help='A previous JSON result file to compare against.')
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help='Percent slowdown of the median reported as a regression.')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be positive.')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            dataset = generate_dataset(options['customers'], options['transactions'], options['seed'])
+            results = run_benchmarks(options['repeat'], options['only'], options['seed'], dataset)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f'{"benchmark":<26} {"mean ms":>9} {"p50 ms":>9} {"p95 ms":>9} {"queries":>8} {"alloc KiB":>10}')
+        for name, result in results['results'].items():
+            self.stdout.write(
+                f'{name:<26} {result["mean_ms"]:>9.2f} {result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} '
+                f'{result["queries"]:>8} {result["peak_alloc_kb"]:>10.1f}'
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Wrote results to {options["output"]}.'))
+
+        if baseline is None:
+            return
+        regressions = []
+        self.stdout.write(f'\n{"benchmark":<26} {"baseline":>9} {"current":>9} {"change":>8}')
+        for name, before, after, change in compare_results(baseline, results):
+            line = f'{name:<26} {before:>9.2f} {after:>9.2f} {change:>+7.1f}%'
+            if change > options['threshold']:
+                regressions.append(name)
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'Regressions over {options["threshold"]}%: {", ".join(regressions)}')
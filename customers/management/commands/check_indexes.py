@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from customers.models import Customer, Transaction
+
+
+def representative_queries():
+    """The hot queries of the viewsets, as (description, queryset, index the plan must use)."""
+    now = timezone.now()
+    return [
+        ('active transactions of a customer by date',
+         Transaction.objects.filter(customer_id=1).order_by('date', 'id'),
+         'transaction_customer_date'),
+        ('newest active transactions of a customer',
+         Transaction.objects.filter(customer_id=1).order_by('-date', '-id')[:50],
+         'transaction_customer_date'),
+        ("a customer's active transactions in a date range",
+         Transaction.objects.filter(customer_id=1, date__gte=now - timedelta(days=30), date__lt=now)
+         .order_by('date', 'id'),
+         'transaction_customer_date'),
+        ('active transactions in a date range',
+         Transaction.objects.filter(date__gte=now - timedelta(days=30), date__lt=now).order_by('date', 'id'),
+         'transaction_date_id_active'),
+        ('keyset page of active transactions',
+         Transaction.objects.filter(date__gt=now - timedelta(days=1)).order_by('date', 'id')[:50],
+         'transaction_date_id_active'),
+        ('active customer by email',
+         Customer.objects.filter(email='milad@example.com'),
+         'customer_email_active_unique'),
+        ('keyset page of active customers',
+         Customer.objects.filter(created_at__gt=now - timedelta(days=1)).order_by('created_at', 'id')[:50],
+         'customer_created_id_active'),
+    ]
+
+
+def explain(queryset):
+    """The plan of `queryset`. On PostgreSQL sequential scans are disabled, so small tables still show the usable index."""
+    if connection.vendor != 'postgresql':
+        return queryset.explain()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot queries of the customers viewsets and fail if one of them does not use its index.'
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f'Index checks are only defined for SQLite and PostgreSQL, not {connection.vendor}.')
+
+        failures = []
+        for description, queryset, index in representative_queries():
+            plan = explain(queryset)
+            if index in plan:
+                self.stdout.write(f'{self.style.SUCCESS("OK")}   {description} uses {index}')
+            else:
+                failures.append(description)
+                self.stdout.write(f'{self.style.ERROR("FAIL")} {description} does not use {index}')
+            if options['verbosity'] > 1 or index not in plan:
+                self.stdout.write('\n'.join(f'       {line}' for line in plan.splitlines()))
+
+        if failures:
+            raise CommandError(f'{len(failures)} queries do not use their index.')
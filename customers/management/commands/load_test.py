@@ -0,0 +1,73 @@
+import asyncio
+import statistics
+import time
+
+import aiohttp
+from django.core.management.base import BaseCommand, CommandError
+
+
+async def _run_level(url, concurrency, total, timeout):
+    """
+    Send `total` GETs to `url` with `concurrency` in flight, returning
+    (elapsed, latencies of the successful requests, errors).
+    """
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker(session):
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                async with session.get(url) as response:
+                    await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+                continue
+            if response.status >= 400:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        return time.perf_counter() - started, latencies, errors
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = ('Load-test an endpoint at increasing concurrency and report throughput and latency, '
+            'e.g. to compare the sync (WSGI) and async (ASGI) deployments.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='e.g. http://localhost:8000/api/customers/search/?query=milad')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 128])
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per concurrency level.')
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        if any(level < 1 for level in options['concurrency']):
+            raise CommandError('Concurrency levels must be positive.')
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive.')
+
+        self.stdout.write(f'{"concurrency":>11} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+        for concurrency in options['concurrency']:
+            elapsed, latencies, errors = asyncio.run(
+                _run_level(options['url'], concurrency, options['requests'], options['timeout']))
+            if not latencies:
+                self.stdout.write(f'{concurrency:>11} {0:>9.1f} {"-":>8} {"-":>8} {"-":>8} {errors:>7}')
+                continue
+            self.stdout.write(
+                f'{concurrency:>11} {len(latencies) / elapsed:>9.1f} '
+                f'{statistics.median(latencies) * 1000:>8.1f} '
+                f'{_percentile(latencies, 95) * 1000:>8.1f} '
+                f'{_percentile(latencies, 99) * 1000:>8.1f} {errors:>7}'
+            )
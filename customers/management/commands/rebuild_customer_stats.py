@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from customers.models import ArchivedTransaction, CustomerDailyStats, Transaction
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-customer daily transaction rollup from the transactions table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customer', type=int, action='append', dest='customers',
+                            help='Only rebuild these customer ids (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        transactions = Transaction.objects.all()
+        archived = ArchivedTransaction.objects.filter(deleted_at__isnull=True)
+        rollups = CustomerDailyStats.objects.all()
+        if options['customers']:
+            transactions = transactions.filter(customer_id__in=options['customers'])
+            archived = archived.filter(customer_id__in=options['customers'])
+            rollups = rollups.filter(customer_id__in=options['customers'])
+
+        rows = (
+            transactions.annotate(day=TruncDate('date'))
+            .values('customer_id', 'day')
+            .annotate(total_amount=Sum('amount'), transaction_count=Count('id'))
+            .order_by()
+            .iterator(chunk_size=options['batch_size'])
+        )
+
+        created = 0
+        with transaction.atomic():
+            rollups.delete()
+            batch = []
+            for row in rows:
+                batch.append(CustomerDailyStats(**row))
+                if len(batch) >= options['batch_size']:
+                    created += len(CustomerDailyStats.objects.bulk_create(batch))
+                    batch = []
+            created += len(CustomerDailyStats.objects.bulk_create(batch))
+
+            # Archived transactions still count towards the customer's history
+            archived_rows = (
+                archived.annotate(day=TruncDate('date'))
+                .values('customer_id', 'day')
+                .annotate(total_amount=Sum('amount'), transaction_count=Count('id'))
+                .order_by()
+                .iterator(chunk_size=options['batch_size'])
+            )
+            CustomerDailyStats.apply({
+                (row['customer_id'], row['day']): (row['total_amount'], row['transaction_count'])
+                for row in archived_rows
+            })
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {created} daily rollup rows.'))
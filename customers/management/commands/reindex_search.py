@@ -0,0 +1,174 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django_elasticsearch_dsl.registries import registry
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk
+
+# Rows written shortly before the load started may commit after it read them
+CATCH_UP_MARGIN = timedelta(minutes=1)
+
+
+def split_id_ranges(min_id, max_id, parts):
+    """Split [min_id, max_id] into at most `parts` half-open (start, end) id ranges."""
+    if min_id is None:
+        return []
+    span = max_id - min_id + 1
+    step = max(1, -(-span // parts))
+    return [(start, min(start + step, max_id + 1)) for start in range(min_id, max_id + 1, step)]
+
+
+def changed_since(model, since, max_id):
+    """Rows created after the `max_id` high-water mark, or updated, soft deleted or restored since `since`."""
+    condition = Q(pk__gt=max_id) if max_id is not None else Q()
+    field_names = {field.name for field in model._meta.get_fields()}
+    for name in ('updated_at', 'deleted_at'):
+        if name in field_names:
+            condition |= Q(**{f'{name}__gte': since})
+    return model._base_manager.filter(condition)
+
+
+def index_queryset(document, client, index_name, queryset, chunk_size):
+    """Bulk-load `queryset` into `index_name`, returning the number of rows indexed."""
+    def actions():
+        for instance in queryset.select_related().order_by('pk').iterator(chunk_size=chunk_size):
+            if document.should_index_object(instance):
+                action = document._prepare_action(instance, 'index')
+                action['_index'] = index_name
+                yield action
+
+    indexed, _ = bulk(client, actions(), chunk_size=chunk_size, refresh=False)
+    return indexed
+
+
+def _init_worker():
+    # Under the spawn start method the worker starts without configured apps
+    django.setup()
+
+
+def _index_range(document_path, index_name, start, end, chunk_size):
+    """Bulk-load the rows with start <= pk < end into `index_name`, returning the number indexed."""
+    document = import_string(document_path)()
+    client = Elasticsearch(**settings.ELASTICSEARCH_DSL['default'])
+    queryset = document.django.model._base_manager.filter(pk__gte=start, pk__lt=end)
+    indexed = index_queryset(document, client, index_name, queryset, chunk_size)
+    connections.close_all()
+    return indexed
+
+
+class Command(BaseCommand):
+    help = ('Rebuild search indices into new timestamped indices with a process pool, catch up '
+            'on the rows written meanwhile, then atomically switch each alias to its new index.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--index', action='append', dest='indices',
+                            help='Only reindex these aliases, e.g. customers (repeatable).')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--keep-old', action='store_true', help='Keep the previous indices after the swap.')
+
+    def handle(self, *args, **options):
+        documents = {document._index._name: document for document in registry.get_documents()}
+        aliases = options['indices'] or sorted(documents)
+        unknown = set(aliases) - set(documents)
+        if unknown:
+            raise CommandError(f'Unknown indices: {", ".join(sorted(unknown))}')
+
+        for alias in aliases:
+            self.reindex(alias, documents[alias], options)
+
+    def reindex(self, alias, document, options):
+        client = document._get_connection()
+        index_name = f'{alias}-{timezone.now():%Y%m%d%H%M%S}'
+        index_settings = document._index.to_dict().get('settings', {})
+        replicas = index_settings.get('number_of_replicas', 1)
+        refresh_interval = index_settings.get('refresh_interval', '1s')
+
+        # Load without refreshes or replicas, they are restored before the swap
+        index = document._index.clone(name=index_name)
+        index.settings(refresh_interval='-1', number_of_replicas=0)
+        index.create(using=client)
+        self.stdout.write(f'Created {index_name}, loading rows...')
+
+        try:
+            indexed, started, max_id = self.load(document, index_name, options)
+            # Writes made during the load went through the alias to the old index
+            since, high_water = timezone.now(), self.max_id(document)
+            self.catch_up(document, client, index_name, started, max_id, options)
+
+            client.indices.put_settings(index=index_name, settings={
+                'index': {'refresh_interval': refresh_interval, 'number_of_replicas': replicas},
+            })
+            client.indices.refresh(index=index_name)
+            old_indices = self.swap_alias(client, alias, index_name)
+        except BaseException:
+            self.stderr.write(f'Reindexing {alias} failed, deleting {index_name}.')
+            client.indices.delete(index=index_name, ignore_unavailable=True)
+            raise
+
+        # And writes made during the catch-up
+        self.catch_up(document, client, index_name, since, high_water, options)
+
+        if not options['keep_old']:
+            for old_index in old_indices:
+                client.indices.delete(index=old_index, ignore_unavailable=True)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} rows into {index_name}, now aliased as {alias}.'))
+
+    @staticmethod
+    def max_id(document):
+        return document.django.model._base_manager.aggregate(max_id=Max('pk'))['max_id']
+
+    def load(self, document, index_name, options):
+        """Load every row with the process pool, returning `(indexed, start time, highest pk loaded)`."""
+        started = timezone.now()
+        model = document.django.model
+        bounds = model._base_manager.aggregate(min_id=Min('pk'), max_id=Max('pk'))
+        ranges = split_id_ranges(bounds['min_id'], bounds['max_id'], options['workers'] * 4)
+        document_path = f'{document.__module__}.{document.__name__}'
+
+        # Workers open their own database connections
+        connections.close_all()
+        indexed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            futures = [
+                pool.submit(_index_range, document_path, index_name, start, end, options['chunk_size'])
+                for start, end in ranges
+            ]
+            for future in as_completed(futures):
+                indexed += future.result()
+        return indexed, started, bounds['max_id']
+
+    def catch_up(self, document, client, index_name, since, max_id, options):
+        """
+        Index the rows created or changed since `since` directly into `index_name`.
+
+        Rows hard deleted meanwhile, e.g. by archive_transactions, are not
+        caught up: run the archive and the reindex at different times.
+        """
+        queryset = changed_since(document.django.model, since - CATCH_UP_MARGIN, max_id)
+        indexed = index_queryset(document(), client, index_name, queryset, options['chunk_size'])
+        if indexed:
+            self.stdout.write(f'Caught up on {indexed} rows written meanwhile.')
+
+    def swap_alias(self, client, alias, index_name):
+        """Point `alias` at `index_name` in a single update_aliases call, returning the previous indices."""
+        actions = [{'add': {'index': index_name, 'alias': alias, 'is_write_index': True}}]
+        if client.indices.exists_alias(name=alias):
+            old_indices = list(client.indices.get_alias(name=alias))
+            actions = [{'remove': {'index': old, 'alias': alias}} for old in old_indices] + actions
+        elif client.indices.exists(index=alias):
+            # First run: the live index still has the alias name, drop it in the same atomic call
+            actions.insert(0, {'remove_index': {'index': alias}})
+            old_indices = []
+        else:
+            old_indices = []
+        client.indices.update_aliases(actions=actions)
+        return old_indices
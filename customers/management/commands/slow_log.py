@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from customers.slowlog import get_slow_log_setting, slow_log
+
+
+class Command(BaseCommand):
+    help = 'Show the slow queries and searches recorded by the customers views, most recent first.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=['query', 'search'])
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help='Print the entries as JSON lines.')
+        parser.add_argument('--clear', action='store_true', help='Empty the log after printing it.')
+
+    def handle(self, *args, **options):
+        if not get_slow_log_setting('ENABLED'):
+            self.stderr.write(self.style.WARNING("SLOW_LOG['ENABLED'] is off, no new entries are recorded."))
+
+        entries = slow_log.entries(options['kind'], options['limit'])
+        for entry in entries:
+            if options['json']:
+                self.stdout.write(json.dumps(entry, default=str))
+                continue
+            header = f'{entry["time"]} {entry["kind"]} {entry["view"]} {entry["duration_ms"]} ms'
+            if entry['kind'] == 'query':
+                self.stdout.write(self.style.MIGRATE_HEADING(header))
+                self.stdout.write(f'{entry["sql"]}\n  params: {entry["params"]}')
+                if entry['plan']:
+                    self.stdout.write('  plan:\n' + '\n'.join(f'    {line}' for line in entry['plan'].splitlines()))
+            else:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{header} (took {entry["took_ms"]} ms)'))
+                self.stdout.write(f'{entry["index"]}: {json.dumps(entry["body"])}')
+
+        if not options['json']:
+            self.stdout.write(f'{len(entries)} entries.')
+        if options['clear']:
+            slow_log.clear()
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-17 17:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total Amount')),
+                ('transaction_count', models.IntegerField(default=0, verbose_name='Transaction Count')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='customers.customer')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='customerdailystats',
+            constraint=models.UniqueConstraint(fields=('customer', 'day'), name='customer_daily_stats_unique'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.7 on 2026-10-17 17:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0007_customerdailystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Amount')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Description')),
+                ('date', models.DateTimeField(verbose_name='Date')),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to='customers.customer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer', 'date'], name='archived_customer_date'), models.Index(fields=['date', 'id'], name='archived_date_id')],
+            },
+        ),
+    ]
@@ -1,6 +1,83 @@
-from django.db import models
+from collections import defaultdict
+from decimal import Decimal
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Max, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.dispatch import Signal
 from django.utils import timezone
 
+# Sent with the affected `pks` after a queryset-level soft delete or restore
+soft_deleted = Signal()
+restored = Signal()
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+    def soft_delete(self, deleted_at=None):
+        """Mark every active row as deleted with set-based UPDATEs, without loading instances."""
+        deleted_at = deleted_at or timezone.now()
+        with transaction.atomic():
+            count = self.filter(deleted_at__isnull=True).update(**self._touched(deleted_at=deleted_at))
+            # The shared timestamp identifies the rows marked by this call
+            marked = self.model.all_objects.filter(deleted_at=deleted_at)
+            self._cascade_soft_delete(marked, deleted_at)
+            pks = list(marked.values_list('pk', flat=True))
+        soft_deleted.send(sender=self.model, pks=pks)
+        return count
+
+    def restore(self):
+        """Restore every soft-deleted row with set-based UPDATEs."""
+        with transaction.atomic():
+            deleted = self.filter(deleted_at__isnull=False)
+            pks = list(deleted.values_list('pk', flat=True))
+            self._cascade_restore(self.model.all_objects.filter(pk__in=deleted.values('pk')))
+            deleted.update(**self._touched(deleted_at=None))
+        restored.send(sender=self.model, pks=pks)
+        return len(pks)
+
+    def delete(self):
+        """Soft delete, like the instance `delete`; use `hard_delete` to remove rows."""
+        return self.soft_delete()
+
+    def hard_delete(self):
+        return super().delete()
+
+    def _touched(self, **values):
+        # UPDATE skips auto_now, the reindex catch-up finds changed rows by `updated_at`
+        values['updated_at'] = timezone.now()
+        return values
+
+    def _cascade_soft_delete(self, marked, deleted_at):
+        pass
+
+    def _cascade_restore(self, deleted):
+        pass
+
+
+class CustomerQuerySet(SoftDeleteQuerySet):
+    # Cascaded transactions share the customer's deleted_at, which tells them apart
+    # from the ones deleted earlier on their own, so restore leaves those deleted
+    def _cascade_soft_delete(self, marked, deleted_at):
+        Transaction.objects.filter(customer__in=marked).soft_delete(deleted_at)
+
+    def _cascade_restore(self, deleted):
+        Transaction.all_objects.filter(customer__in=deleted, deleted_at=F('customer__deleted_at')).restore()
+
+
+class TransactionQuerySet(SoftDeleteQuerySet):
+    def rollup_deltas(self, sign=1):
+        """Aggregate the queryset into {(customer_id, day): (amount, count)} rollup deltas."""
+        rows = (self.annotate(day=TruncDate('date'))
+                .values('customer_id', 'day')
+                .annotate(total=Sum('amount'), count=Count('pk'))
+                .order_by())
+        return {(row['customer_id'], row['day']): (sign * row['total'], sign * row['count']) for row in rows}
+
+    def _cascade_soft_delete(self, marked, deleted_at):
+        CustomerDailyStats.apply(marked.rollup_deltas(sign=-1))
+
+    def _cascade_restore(self, deleted):
+        CustomerDailyStats.apply(deleted.rollup_deltas())
+
 
 class SoftDeleteManager(models.Manager):
     def get_queryset(self):
@@ -10,7 +87,7 @@ class SoftDeleteManager(models.Manager):
 class TimeFields(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
-    deleted_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    deleted_at = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         abstract = True
@@ -18,23 +95,39 @@ class TimeFields(models.Model):
 
 class Customer(TimeFields):
     name = models.CharField("Name", max_length=32)
-    email = models.EmailField("Email", unique=True)
+    email = models.EmailField("Email")
     phone = models.CharField("Phone", max_length=20)
     loyalty_score = models.IntegerField("Loyalty Score", default=0)
-    objects = SoftDeleteManager()  # Manager for active records
-    all_objects = models.Manager()  # Manager for all records, including soft-deleted
+    objects = SoftDeleteManager.from_queryset(CustomerQuerySet)()  # Manager for active records
+    all_objects = CustomerQuerySet.as_manager()  # Manager for all records, including soft-deleted
+
+    class Meta:
+        indexes = [
+            # Keyset pagination over active customers
+            models.Index(fields=['created_at', 'id'], name='customer_created_id_active',
+                         condition=Q(deleted_at__isnull=True)),
+            # Only deleted rows, so the planner cannot pick it over the active indexes
+            models.Index(fields=['deleted_at'], name='customer_deleted',
+                         condition=Q(deleted_at__isnull=False)),
+        ]
+        constraints = [
+            # Emails of soft-deleted customers can be reused
+            models.UniqueConstraint(fields=['email'], name='customer_email_active_unique',
+                                    condition=Q(deleted_at__isnull=True)),
+        ]
 
     def delete(self,  *args, **kwargs):
         """Mark the instance and related transactions as deleted."""
         self.deleted_at = timezone.now()
         self.save()
-        self.transactions.all().update(deleted_at=self.deleted_at)
+        Transaction.objects.filter(customer=self).soft_delete(self.deleted_at)
 
     def restore(self):
-        """Restore a soft-deleted instance and its related transactions."""
-        self.deleted_at = None
+        """Restore a soft-deleted instance and the transactions deleted along with it."""
+        deleted_at, self.deleted_at = self.deleted_at, None
         self.save()
-        self.transactions.all().update(deleted_at=None)
+        if deleted_at is not None:
+            Transaction.all_objects.filter(customer=self, deleted_at=deleted_at).restore()
 
     def __str__(self):
         return self.name
@@ -45,19 +138,159 @@ class Transaction(models.Model):
     amount = models.DecimalField("Amount", max_digits=10, decimal_places=2)
     description = models.TextField("Description", null=True, blank=True)
     date = models.DateTimeField("Date", default=timezone.now)
-    deleted_at = models.DateTimeField(blank=True, null=True, db_index=True)
-    objects = SoftDeleteManager()  # Manager for active records
-    all_objects = models.Manager()  # Manager for all records, including soft-deleted
+    updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
+    deleted_at = models.DateTimeField(blank=True, null=True)
+    objects = SoftDeleteManager.from_queryset(TransactionQuerySet)()  # Manager for active records
+    all_objects = TransactionQuerySet.as_manager()  # Manager for all records, including soft-deleted
+
+    class Meta:
+        indexes = [
+            # Keyset pagination over active transactions
+            models.Index(fields=['date', 'id'], name='transaction_date_id_active',
+                         condition=Q(deleted_at__isnull=True)),
+            # A customer's active transactions by date, `id` breaks ties for keyset pagination
+            models.Index(fields=['customer', 'date', 'id'], name='transaction_customer_date',
+                         condition=Q(deleted_at__isnull=True)),
+            # Only deleted rows, so the planner cannot pick it over the active indexes
+            models.Index(fields=['deleted_at'], name='transaction_deleted',
+                         condition=Q(deleted_at__isnull=False)),
+        ]
 
     def __str__(self):
         return f"{self.customer.name} - {self.amount}"
 
     def delete(self, *args, **kwargs):
         """Mark the instance as deleted."""
+        was_active = self.deleted_at is None
         self.deleted_at = timezone.now()
         self.save()
+        if was_active:
+            CustomerDailyStats.apply(rollup_deltas([self], sign=-1))
 
     def restore(self):
         """Restore a soft-deleted instance."""
+        was_deleted = self.deleted_at is not None
         self.deleted_at = None
         self.save()
+        if was_deleted:
+            CustomerDailyStats.apply(rollup_deltas([self]))
+
+
+class ArchivedTransaction(models.Model):
+    """Transaction moved out of the hot table by `archive_transactions`, keeping its id."""
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='archived_transactions')
+    amount = models.DecimalField("Amount", max_digits=10, decimal_places=2)
+    description = models.TextField("Description", null=True, blank=True)
+    date = models.DateTimeField("Date")
+    deleted_at = models.DateTimeField(blank=True, null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'date'], name='archived_customer_date'),
+            models.Index(fields=['date', 'id'], name='archived_date_id'),
+        ]
+
+    def __str__(self):
+        return f"{self.customer_id} - {self.amount}"
+
+
+def rollup_deltas(transactions, sign=1):
+    """Group transactions into {(customer_id, day): (amount, count)} rollup deltas."""
+    deltas = defaultdict(lambda: (Decimal(0), 0))
+    for item in transactions:
+        key = (item.customer_id, timezone.localdate(item.date))
+        amount, count = deltas[key]
+        deltas[key] = (amount + sign * Decimal(str(item.amount)), count + sign)
+    return dict(deltas)
+
+
+class CustomerDailyStats(models.Model):
+    """Per-customer daily totals of active transactions, maintained incrementally."""
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField("Day")
+    total_amount = models.DecimalField("Total Amount", max_digits=14, decimal_places=2, default=0)
+    transaction_count = models.IntegerField("Transaction Count", default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'day'], name='customer_daily_stats_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.customer_id} - {self.day}"
+
+    @classmethod
+    def _existing_rows(cls, keys):
+        """Map the (customer_id, day) keys that already have a row to its pk, with one query."""
+        customer_ids = {customer_id for customer_id, _ in keys}
+        days = {day for _, day in keys}
+        rows = cls.objects.filter(customer_id__in=customer_ids, day__in=days).values_list('pk', 'customer_id', 'day')
+        return {(customer_id, day): pk for pk, customer_id, day in rows if (customer_id, day) in keys}
+
+    @classmethod
+    def apply(cls, deltas, batch_size=500):
+        """
+        Add rollup deltas set-based: one query finds the existing days, one
+        INSERT creates the missing ones and one UPDATE per batch increments the
+        others in the database.
+        """
+        if not deltas:
+            return
+        existing = cls._existing_rows(deltas.keys())
+        missing = [key for key in deltas if key not in existing]
+        if missing:
+            try:
+                with transaction.atomic():
+                    cls.objects.bulk_create([
+                        cls(customer_id=customer_id, day=day, total_amount=deltas[customer_id, day][0],
+                            transaction_count=deltas[customer_id, day][1])
+                        for customer_id, day in missing
+                    ])
+            except IntegrityError:
+                # Some days were created concurrently, start over to add to them instead
+                return cls.apply(deltas, batch_size)
+
+        increments = [(pk, deltas[key]) for key, pk in existing.items()]
+        for start in range(0, len(increments), batch_size):
+            batch = increments[start:start + batch_size]
+            amount = Case(
+                *[When(pk=pk, then=Value(delta[0])) for pk, delta in batch],
+                default=Value(Decimal(0)),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2),
+            )
+            count = Case(
+                *[When(pk=pk, then=Value(delta[1])) for pk, delta in batch],
+                default=Value(0),
+                output_field=models.IntegerField(),
+            )
+            cls.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+                total_amount=F('total_amount') + amount,
+                transaction_count=F('transaction_count') + count,
+            )
+
+    @classmethod
+    def summarize(cls, customer_ids):
+        """Return total, count, average and last transaction day for each customer."""
+        rollups = {
+            row['customer_id']: row
+            for row in cls.objects.filter(customer_id__in=customer_ids)
+            .values('customer_id')
+            .annotate(total=Sum('total_amount'),
+                      count=Sum('transaction_count'),
+                      last_day=Max('day', filter=Q(transaction_count__gt=0)))
+        }
+        stats = []
+        for customer_id in customer_ids:
+            row = rollups.get(customer_id, {})
+            total_amount = row.get('total') or Decimal(0)
+            transaction_count = row.get('count') or 0
+            stats.append({
+                'customer': customer_id,
+                'total_amount': total_amount,
+                'transaction_count': transaction_count,
+                'average_amount': total_amount / transaction_count if transaction_count else None,
+                'last_transaction_date': row.get('last_day'),
+            })
+        return stats
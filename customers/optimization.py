@@ -0,0 +1,62 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+READ_ACTIONS = ('list', 'retrieve')
+
+
+def _collect(serializer, prefix, select_related, only):
+    model = serializer.Meta.model
+    complete = True
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        name = field.source.split('.')[0]
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Properties, methods and source='*' may read any column, so keep the full row
+            complete = False
+            continue
+        if model_field.many_to_many or model_field.one_to_many:
+            complete = False
+            continue
+        only.append(prefix + model_field.name)
+        if model_field.many_to_one or model_field.one_to_one:
+            if isinstance(field, serializers.ModelSerializer):
+                select_related.append(prefix + name)
+                complete = _collect(field, f'{prefix}{name}__', select_related, only) and complete
+            elif '.' in field.source:
+                select_related.append(prefix + name)
+                complete = False
+    return complete
+
+
+@lru_cache(maxsize=None)
+def get_query_plan(serializer_class):
+    """
+    Return the `(select_related, only)` paths needed to render `serializer_class`.
+
+    `only` is None when the serializer reads attributes that are not plain model
+    fields, in which case the full rows are loaded.
+    """
+    select_related, only = [], []
+    complete = _collect(serializer_class(), '', select_related, only)
+    return tuple(select_related), tuple(dict.fromkeys(only)) if complete else None
+
+
+class OptimizedQuerysetMixin:
+    """Join and restrict the viewset queryset to what its serializer renders."""
+
+    def get_queryset(self):
+        return self.optimize_queryset(super().get_queryset())
+
+    def optimize_queryset(self, queryset):
+        select_related, only = get_query_plan(self.get_serializer_class())
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        # Deferred columns are only safe when nothing is written back
+        if only and self.action in READ_ACTIONS:
+            queryset = queryset.only(*only)
+        return queryset
@@ -0,0 +1,231 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """Return the planner's row estimate for `queryset`, or None if the backend has no estimate."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class LimitOffsetCountPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination whose total count can be skipped or estimated.
+
+    `?count=exact` (default) runs COUNT(*), `?count=approximate` uses the query
+    planner estimate where available and `?count=none` skips the count, fetching
+    one extra row to know whether there is a next page. An exact count already
+    computed by the view, e.g. by ConditionalRequestMixin, is reused.
+    """
+    count_query_param = 'count'
+    count_modes = ('exact', 'approximate', 'none')
+
+    def get_count_mode(self, request):
+        mode = request.query_params.get(self.count_query_param)
+        return mode if mode in self.count_modes else 'exact'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_mode = self.get_count_mode(request)
+        self.known_count = getattr(view, 'validated_count', None)
+        if self.count_mode != 'none':
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count = None
+        self.offset = self.get_offset(request)
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async `paginate_queryset` for the async views."""
+        self.count_mode = self.get_count_mode(request)
+        self.known_count = getattr(view, 'validated_count', None)
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+
+        if self.count_mode == 'none':
+            self.count = None
+            rows = [row async for row in queryset[self.offset:self.offset + self.limit + 1]]
+            self.has_next = len(rows) > self.limit
+            return rows[:self.limit]
+
+        self.count = await self.aget_count(queryset)
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return [row async for row in queryset[self.offset:self.offset + self.limit]]
+
+    def get_count(self, queryset):
+        if self.known_count is not None:
+            return self.known_count
+        if self.count_mode == 'approximate':
+            estimate = estimate_count(queryset)
+            if estimate is not None:
+                return estimate
+        return super().get_count(queryset)
+
+    async def aget_count(self, queryset):
+        if self.known_count is not None:
+            return self.known_count
+        if self.count_mode == 'approximate':
+            estimate = await sync_to_async(estimate_count)(queryset)
+            if estimate is not None:
+                return estimate
+        return await queryset.acount()
+
+    def get_next_link(self):
+        if self.count is not None:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a unique composite ordering such as `('date', 'id')`.
+
+    Each page is fetched with a range condition on the ordering columns instead
+    of an OFFSET, and no total count is computed, so walking the whole table
+    costs the same per page regardless of depth.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = self.get_position(rows[-1]) if self.has_next else None
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([row async for row in self.get_page_queryset(queryset, request)])
+
+    def get_position(self, row):
+        return [getattr(row, field.lstrip('-')) for field in self.ordering]
+
+    def get_position_filter(self, position):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {f.lstrip('-'): value for f, value in zip(self.ordering[:index], position)}
+            condition |= Q(**equal, **{f'{name}__{lookup}': position[index]})
+        return condition
+
+    def encode_cursor(self, position):
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in position]
+        return urlsafe_b64encode(json.dumps(values).encode()).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            values = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                self.model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_first_link(self):
+        return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'results': data,
+        })
+
+
+class KeysetPaginationMixin:
+    """Switch a viewset to `KeysetPagination` on `?pagination=cursor`."""
+    keyset_ordering = None
+    pagination_mode_query_param = 'pagination'
+
+    def use_keyset_pagination(self):
+        query_params = self.request.query_params
+        return bool(self.keyset_ordering) and (
+            query_params.get(self.pagination_mode_query_param) == 'cursor'
+            or KeysetPagination.cursor_query_param in query_params
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.use_keyset_pagination():
+                self._paginator = KeysetPagination(self.keyset_ordering)
+            else:
+                return super().paginator
+        return self._paginator
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django_elasticsearch_dsl_drf.serializers import DocumentSerializer
 from .models import (
+    ArchivedTransaction,
     Customer,
     Transaction)
 from .documents import (
@@ -15,6 +16,18 @@ class CustomerSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
 
+class CustomerIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=100000)
+
+
+class CustomerStatsSerializer(serializers.Serializer):
+    customer = serializers.IntegerField()
+    total_amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+    transaction_count = serializers.IntegerField()
+    average_amount = serializers.DecimalField(max_digits=14, decimal_places=2, allow_null=True)
+    last_transaction_date = serializers.DateField(allow_null=True)
+
+
 class CustomerDocumentSerializer(DocumentSerializer):
     class Meta:
         document = CustomerDocument
@@ -31,6 +44,20 @@ class TransactionSerializer(serializers.ModelSerializer):
         read_only_fields = ['date', 'customer_info']
 
 
+class ArchivedTransactionSerializer(TransactionSerializer):
+
+    class Meta(TransactionSerializer.Meta):
+        model = ArchivedTransaction
+
+
+class BulkTransactionSerializer(serializers.ModelSerializer):
+    customer = serializers.IntegerField(source='customer_id')
+
+    class Meta:
+        model = Transaction
+        fields = ['customer', 'amount', 'description', 'date']
+
+
 class TransactionDocumentSerializer(DocumentSerializer):
     class Meta:
         document = TransactionDocument
@@ -1,11 +1,79 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from .models import Transaction
+from django.utils import timezone
+from .cache import bump_generation, customer_transactions_namespace, delete_detail_keys, reset_generations
+from .indexing import index_queue
+from .models import Customer, CustomerDailyStats, Transaction, restored, rollup_deltas, soft_deleted
+
+
+def refresh_customers(increments):
+    """Invalidate cached customers and their transaction lists, and queue them for reindexing."""
+    delete_detail_keys(f'customer_{customer_id}' for customer_id in increments)
+    bump_generation('customers')
+    reset_generations(customer_transactions_namespace(customer_id) for customer_id in increments)
+    index_queue.put(Customer, increments)
+
+
+def increment_loyalty_scores(increments, batch_size=500):
+    """Apply {customer_id: increment} with one UPDATE per batch of customers."""
+    customer_ids = list(increments)
+    now = timezone.now()
+    for start in range(0, len(customer_ids), batch_size):
+        batch = customer_ids[start:start + batch_size]
+        increment = Case(
+            *[When(pk=customer_id, then=Value(increments[customer_id])) for customer_id in batch],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        Customer.all_objects.filter(pk__in=batch).update(
+            loyalty_score=F('loyalty_score') + increment,
+            updated_at=now,
+        )
+    transaction.on_commit(lambda: refresh_customers(increments))
 
 
 @receiver(post_save, sender=Transaction)
 def update_customer_loyalty_score(sender, instance, created, **kwargs):
     if created:
-        # Update the customer's loyalty score based on the count of transactions
-        instance.customer.loyalty_score += 1
-        instance.customer.save()
+        # Increment in the database so concurrent transactions never lose an update
+        Customer.all_objects.filter(pk=instance.customer_id).update(
+            loyalty_score=F('loyalty_score') + 1,
+            updated_at=timezone.now(),
+        )
+        if Transaction.customer.is_cached(instance):
+            instance.customer.loyalty_score += 1
+        transaction.on_commit(lambda: refresh_customers({instance.customer_id: 1}))
+
+
+@receiver(post_save, sender=Transaction)
+def update_customer_daily_stats(sender, instance, created, **kwargs):
+    if created and instance.deleted_at is None:
+        CustomerDailyStats.apply(rollup_deltas([instance]))
+
+
+@receiver(post_save, sender=Transaction)
+def invalidate_customer_transactions(sender, instance, created, **kwargs):
+    # New transactions are handled by refresh_customers, this covers edits, delete() and restore()
+    if not created:
+        namespace = customer_transactions_namespace(instance.customer_id)
+        transaction.on_commit(lambda: reset_generations([namespace]))
+
+
+@receiver([soft_deleted, restored], sender=Customer)
+def refresh_soft_deleted_customers(sender, pks, **kwargs):
+    delete_detail_keys(f'customer_{pk}' for pk in pks)
+    bump_generation('customers')
+    bump_generation('transactions')
+    reset_generations(customer_transactions_namespace(pk) for pk in pks)
+    index_queue.put_on_commit(Customer, pks)
+
+
+@receiver([soft_deleted, restored], sender=Transaction)
+def refresh_soft_deleted_transactions(sender, pks, **kwargs):
+    delete_detail_keys(f'transaction_{pk}' for pk in pks)
+    bump_generation('transactions')
+    customer_ids = Transaction.all_objects.filter(pk__in=pks).values_list('customer_id', flat=True).distinct()
+    reset_generations(customer_transactions_namespace(customer_id) for customer_id in customer_ids)
+    index_queue.put_on_commit(Transaction, pks)
@@ -0,0 +1,206 @@
+import json
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import transaction
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+SLOW_LOG_DEFAULTS = {
+    'ENABLED': False,
+    'QUERY_THRESHOLD': 0.1,  # Seconds
+    'SEARCH_THRESHOLD': 0.2,  # Seconds
+    'EXPLAIN': True,  # Capture the plan of slow SELECTs
+    'MAX_ENTRIES': 200,
+    'KEY': 'slow-log',
+}
+
+# Name of the customers view being served, None outside of them
+_view = ContextVar('slow_log_view', default=None)
+
+
+def get_slow_log_setting(name):
+    return getattr(settings, 'SLOW_LOG', {}).get(name, SLOW_LOG_DEFAULTS[name])
+
+
+class SlowLog:
+    """
+    Ring buffer of the most recent `MAX_ENTRIES` slow queries and searches, newest first.
+
+    With django_redis the buffer is a Redis list shared by all processes, so
+    the admin page and `manage.py slow_log` see what the workers recorded.
+    Other backends keep a process-local buffer.
+    """
+
+    def __init__(self):
+        self._local = deque()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _connection():
+        try:
+            return get_redis_connection('default')
+        except NotImplementedError:
+            return None
+
+    def record(self, entry):
+        max_entries = get_slow_log_setting('MAX_ENTRIES')
+        connection = self._connection()
+        if connection is None:
+            with self._lock:
+                self._local.appendleft(entry)
+                while len(self._local) > max_entries:
+                    self._local.pop()
+            return
+        try:
+            pipeline = connection.pipeline()
+            pipeline.lpush(get_slow_log_setting('KEY'), json.dumps(entry, default=str))
+            pipeline.ltrim(get_slow_log_setting('KEY'), 0, max_entries - 1)
+            pipeline.execute()
+        except RedisError:
+            logger.warning('Could not record a slow %s entry', entry['kind'], exc_info=True)
+
+    def entries(self, kind=None, limit=None):
+        connection = self._connection()
+        if connection is None:
+            with self._lock:
+                entries = list(self._local)
+        else:
+            entries = [json.loads(entry) for entry in connection.lrange(get_slow_log_setting('KEY'), 0, -1)]
+        if kind:
+            entries = [entry for entry in entries if entry['kind'] == kind]
+        return entries[:limit]
+
+    def clear(self):
+        connection = self._connection()
+        if connection is None:
+            with self._lock:
+                self._local.clear()
+        else:
+            connection.delete(get_slow_log_setting('KEY'))
+
+
+slow_log = SlowLog()
+
+
+def _json(data):
+    try:
+        return json.loads(data)
+    except (TypeError, ValueError):
+        return None
+
+
+def _entry(kind, duration, **fields):
+    return {
+        'kind': kind,
+        'time': timezone.now().isoformat(),
+        'view': _view.get(),
+        'duration_ms': round(duration * 1000, 2),
+        **fields,
+    }
+
+
+def explain(connection, sql, params):
+    """Return the plan of `sql` as text, or None when it cannot be explained."""
+    if sql.lstrip()[:6].upper() != 'SELECT':
+        return None
+    # The EXPLAIN itself must not be logged, and must not break the surrounding transaction if it fails
+    token = _view.set(None)
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    except Exception:
+        logger.debug('Could not explain %s', sql, exc_info=True)
+        return None
+    finally:
+        _view.reset(token)
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    if _view.get() is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    result = execute(sql, params, many, context)
+    duration = perf_counter() - started
+    if duration >= get_slow_log_setting('QUERY_THRESHOLD'):
+        connection = context['connection']
+        plan = explain(connection, sql, params) if get_slow_log_setting('EXPLAIN') and not many else None
+        slow_log.record(_entry(
+            'query', duration, sql=sql, params=None if many else repr(params), plan=plan, database=connection.alias,
+        ))
+    return result
+
+
+def log_slow_queries(sender, connection, **kwargs):
+    """`connection_created` receiver logging the slow queries of every database connection."""
+    if slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_wrapper)
+
+
+def record_slow_search(target, body, response_body, duration):
+    """Log an Elasticsearch `_search` made from a customers view that took `SEARCH_THRESHOLD` or longer."""
+    if _view.get() is None or duration < get_slow_log_setting('SEARCH_THRESHOLD'):
+        return
+    path = target.split('?')[0]
+    if not path.endswith('/_search'):
+        return
+    response = _json(response_body)
+    slow_log.record(_entry(
+        'search', duration, index=path.strip('/').rsplit('/', 1)[0],
+        took_ms=response.get('took') if isinstance(response, dict) else None, body=_json(body),
+    ))
+
+
+class SlowLogMiddleware:
+    """Enable the slow query and search log while a `customers` view handles the request."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _view_name(request):
+        if not get_slow_log_setting('ENABLED'):
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        if not match.func.__module__.startswith('customers.'):
+            return None
+        return match.view_name
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        view_name = self._view_name(request)
+        if view_name is None:
+            return self.get_response(request)
+        token = _view.set(view_name)
+        try:
+            return self.get_response(request)
+        finally:
+            _view.reset(token)
+
+    async def __acall__(self, request):
+        view_name = self._view_name(request)
+        if view_name is None:
+            return await self.get_response(request)
+        token = _view.set(view_name)
+        try:
+            return await self.get_response(request)
+        finally:
+            _view.reset(token)
@@ -1,8 +1,41 @@
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from queue import Queue
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.core.management import CommandError, call_command
+from elasticsearch_dsl.response import Response as EsResponse
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, APITestCase
 from rest_framework import status
 from django.core.cache import cache
-from .models import Customer, Transaction
+from .benchmarks.data import generate_dataset
+from .benchmarks.suite import compare_results, run_benchmarks
+from .cache import LocalCache, get_cache_stats, get_generation, get_redis_pool_config, local_cache, local_hits
+from .checks import check_connection_pools, check_request_timing, connection_pool_report
+from .indexing import IndexQueue, QueuedSignalProcessor, registry
+from .instrumentation import timed, timing_registry
+from .management.commands.reindex_search import changed_since, split_id_ranges
+from .slowlog import _view, record_slow_search, slow_log
+from .models import ArchivedTransaction, Customer, CustomerDailyStats, Transaction
+from .documents import CustomerDocument
+from .export import stream_export
+from .views import (
+    AsyncCustomerSearchApiView,
+    AsyncCustomerTransactionViewSet,
+    AsyncCustomerViewSet,
+    AsyncTransactionViewSet,
+    CustomerSearchApiView,
+    CustomerSuggestApiView,
+    TransactionSearchView)
 
 
 class CustomerViewSetTestCase(APITestCase):
@@ -26,12 +59,24 @@ class CustomerViewSetTestCase(APITestCase):
         self.assertEqual(len(response.data.get('results')), 1)
 
         # Ensure the response data is cached
-        cached_data = cache.get('customers_list')
-        self.assertIsNotNone(cached_data)
+        self.assertEqual(get_cache_stats('customers')['misses'], 1)
 
         # Subsequent request should fetch from the cache
         response = self.client.get(self.list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(get_cache_stats('customers')['hits'], 1)
+
+    def test_list_customers_pages_are_cached_separately(self):
+        Customer.objects.create(name='mehrdad', email='mehrdad.azad@gamil.com', phone='09382061246')
+
+        first_page = self.client.get(self.list_url, {'limit': 1, 'offset': 0})
+        second_page = self.client.get(self.list_url, {'offset': 1, 'limit': 1})
+        self.assertNotEqual(first_page.data['results'], second_page.data['results'])
+
+        # Same parameters in a different order should hit the cache
+        response = self.client.get(self.list_url, {'limit': 1, 'offset': 1})
+        self.assertEqual(response.data['results'], second_page.data['results'])
+        self.assertEqual(get_cache_stats('customers')['hits'], 1)
 
     def test_retrieve_customer(self):
         # Initial request should fetch from the database and cache the response
@@ -58,10 +103,11 @@ class CustomerViewSetTestCase(APITestCase):
         self.assertEqual(Customer.objects.count(), 2)
 
         # Ensure the cache for the customer list is invalidated
-        cache_data = cache.get('customers_list')
-        self.assertIsNone(cache_data)
+        response = self.client.get(self.list_url)
+        self.assertEqual(len(response.data.get('results')), 2)
 
     def test_update_customer(self):
+        generation = get_generation('customers')
         data = {
             "name": "mehrdad",
             "email": "mehrdad.azad@gamil.com",
@@ -75,10 +121,10 @@ class CustomerViewSetTestCase(APITestCase):
         # Ensure the cache for the specific customer and the list is invalidated
         cache_data = cache.get(f'customer_{self.customer.id}')
         self.assertIsNone(cache_data)
-        cache_data = cache.get('customers_list')
-        self.assertIsNone(cache_data)
+        self.assertNotEqual(get_generation('customers'), generation)
 
     def test_delete_customer(self):
+        generation = get_generation('customers')
         response = self.client.delete(self.detail_url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(Customer.objects.count(), 0)
@@ -86,8 +132,7 @@ class CustomerViewSetTestCase(APITestCase):
         # Ensure the cache for the specific customer and the list is invalidated
         cache_data = cache.get(f'customer_{self.customer.id}')
         self.assertIsNone(cache_data)
-        cache_data = cache.get('customers_list')
-        self.assertIsNone(cache_data)
+        self.assertNotEqual(get_generation('customers'), generation)
 
 
 class TransactionViewSetTestCase(APITestCase):
@@ -117,8 +162,7 @@ class TransactionViewSetTestCase(APITestCase):
         self.assertEqual(len(response.data.get('results')), 1)
 
         # Ensure the response data is cached
-        cached_data = cache.get('transactions_list')
-        self.assertIsNotNone(cached_data)
+        self.assertEqual(get_cache_stats('transactions')['misses'], 1)
 
         # Subsequent request should fetch from the cache
         response = self.client.get(self.list_url)
@@ -139,6 +183,7 @@ class TransactionViewSetTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     def test_create_transaction(self):
+        generation = get_generation('transactions')
         data = {
             "amount": "50000.00",
             "description": "New transaction"
@@ -148,14 +193,27 @@ class TransactionViewSetTestCase(APITestCase):
         self.assertEqual(Transaction.objects.count(), 2)
 
         # Ensure the cache for the transaction list is invalidated
-        cache_data = cache.get('transactions_list')
-        self.assertIsNone(cache_data)
+        self.assertNotEqual(get_generation('transactions'), generation)
+
+    def test_create_transaction_increments_loyalty_score(self):
+        customer_url = reverse('customers-detail', args=[self.customer.id])
+        self.client.get(customer_url)
+        self.assertIsNotNone(cache.get(f'customer_{self.customer.id}'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.create_url, {"amount": "10.00"})
+        self.assertEqual(response.data['customer_info']['loyalty_score'], 2)
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.loyalty_score, 2)
+
+        # Ensure the customer detail cache is invalidated
+        self.assertIsNone(cache.get(f'customer_{self.customer.id}'))
 
     def test_cache_invalidation_on_create(self):
         # Ensure the cache is populated initially
-        self.client.get(self.list_url)
-        cached_data = cache.get('transactions_list')
-        self.assertIsNotNone(cached_data)
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.data.get('count'), 1)
 
         # Create a new transaction
         data = {
@@ -165,8 +223,1272 @@ class TransactionViewSetTestCase(APITestCase):
         self.client.post(self.create_url, data)
 
         # Ensure the cache for the transaction list is invalidated
-        cache_data = cache.get('transactions_list')
-        self.assertIsNone(cache_data)
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.data.get('count'), 2)
+
+
+class BulkTransactionTestCase(APITestCase):
+
+    def setUp(self):
+        self.first = Customer.objects.create(name='milad', email='milad.mohammadian@gamil.com', phone='09382061246')
+        self.second = Customer.objects.create(name='mehrdad', email='mehrdad.azad@gamil.com', phone='09382061246')
+        self.bulk_url = reverse('transactions-bulk')
+        self.customer_bulk_url = reverse('customer-bulk-create-transactions', args=[self.first.id])
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_bulk_create_transactions(self):
+        data = [
+            {"customer": self.first.id, "amount": "10.00"},
+            {"customer": self.first.id, "amount": "20.00", "description": "POS"},
+            {"customer": self.second.id, "amount": "30.00"},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.bulk_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(Transaction.objects.count(), 3)
+
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.loyalty_score, 2)
+        self.assertEqual(self.second.loyalty_score, 1)
+
+    def test_bulk_create_for_customer(self):
+        data = [{"amount": "10.00"}, {"amount": "20.00"}]
+        response = self.client.post(self.customer_bulk_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.first.transactions.count(), 2)
+
+    def test_bulk_create_unknown_customer(self):
+        data = [{"customer": self.first.id, "amount": "10.00"}, {"customer": 0, "amount": "20.00"}]
+        response = self.client.post(self.bulk_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+
+class ListQueryCountTestCase(APITestCase):
+
+    def tearDown(self):
+        cache.clear()
+
+    def create_rows(self, count):
+        Customer.objects.bulk_create(
+            Customer(name=f'customer {i}', email=f'customer{i}@gamil.com', phone='09382061246')
+            for i in range(count)
+        )
+        Transaction.objects.bulk_create(
+            Transaction(customer=customer, amount='10.00') for customer in Customer.objects.all()
+        )
+
+    def test_list_query_count_is_constant(self):
+        for count in (10, 100, 1000):
+            with self.subTest(count=count):
+                Transaction.all_objects.all().hard_delete()
+                Customer.all_objects.all().hard_delete()
+                cache.clear()
+                self.create_rows(count)
+
+                # One COUNT(*) and one SELECT, whatever the page size
+                with self.assertNumQueries(2):
+                    response = self.client.get(reverse('transactions-list'), {'limit': count})
+                self.assertEqual(len(response.data['results']), count)
+
+                with self.assertNumQueries(2):
+                    response = self.client.get(reverse('customers-list'), {'limit': count})
+                self.assertEqual(len(response.data['results']), count)
+
+
+class PaginationTestCase(APITestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='milad',
+            email='milad.mohammadian@gamil.com',
+            phone='09382061246',
+        )
+        now = timezone.now()
+        # Pairs of transactions share a date so the id tie-breaker is exercised
+        Transaction.objects.bulk_create(
+            Transaction(customer=self.customer, amount='10.00', date=now - timedelta(days=i // 2))
+            for i in range(25)
+        )
+        self.list_url = reverse('transactions-list')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_keyset_pagination_walks_every_row_once(self):
+        seen = []
+        response = self.client.get(self.list_url, {'pagination': 'cursor', 'limit': 10})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        expected = list(Transaction.objects.order_by('date', 'id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.list_url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_skip_count(self):
+        response = self.client.get(self.list_url, {'count': 'none', 'limit': 10, 'offset': 20})
+        self.assertIsNone(response.data['count'])
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(self.list_url, {'count': 'none', 'limit': 10})
+        self.assertIsNotNone(response.data['next'])
+
+    def test_uncounted_lists_are_validated_without_count(self):
+        for params in ({'pagination': 'cursor', 'limit': 10}, {'count': 'none', 'limit': 10}):
+            with self.subTest(**params):
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    etag = self.client.get(self.list_url, params)['ETag']
+                self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+
+                cache.clear()
+                response = self.client.get(self.list_url, params, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+                # A new row on the page changes its validators
+                transaction = Transaction.objects.create(
+                    customer=self.customer, amount='5.00', date=timezone.now() - timedelta(days=30))
+                cache.clear()
+                response = self.client.get(self.list_url, params, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                Transaction.all_objects.filter(pk=transaction.pk).hard_delete()
+
+
+class ExportTestCase(APITestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='milad',
+            email='milad.mohammadian@gamil.com',
+            phone='09382061246',
+        )
+        other = Customer.objects.create(name='mehrdad', email='mehrdad.azad@gamil.com', phone='09382061246')
+        Transaction.objects.create(customer=self.customer, amount='10.00', date=timezone.now() - timedelta(days=40))
+        Transaction.objects.create(customer=self.customer, amount='20.00', description='POS')
+        Transaction.objects.create(customer=other, amount='30.00')
+        self.export_url = reverse('transactions-export')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_export_ndjson(self):
+        date_from = (timezone.now() - timedelta(days=1)).date().isoformat()
+        response = self.client.get(self.export_url, {
+            'format': 'ndjson', 'customer': str(self.customer.id), 'date_from': date_from,
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['amount'], '20.00')
+        self.assertEqual(rows[0]['customer_name'], 'milad')
+
+    def test_export_csv(self):
+        response = self.client.get(self.export_url, {'format': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response).decode().splitlines()
+        self.assertEqual(lines[0], 'id,customer,customer_name,customer_email,amount,description,date')
+        self.assertEqual(len(lines), 4)
+
+    @override_settings(ASYNC_VIEWS=True)
+    async def test_export_streams_asynchronously_under_asgi(self):
+        queryset = Transaction.objects.order_by('id')
+        response = stream_export(queryset, {'id': 'id', 'amount': 'amount'}, 'csv', 'transactions', chunk_size=4)
+        self.assertTrue(response.is_async)
+        lines = ''.join([chunk.decode() async for chunk in response.streaming_content]).splitlines()
+        self.assertEqual(lines, ['id,amount'] + [f'{pk},{amount}' async for pk, amount in
+                                                 queryset.values_list('id', 'amount')])
+
+    def test_export_invalid_date(self):
+        response = self.client.get(self.export_url, {'format': 'ndjson', 'date_from': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_csv_error_is_csv(self):
+        response = self.client.get(self.export_url, {'format': 'csv', 'date_from': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response.content.decode().splitlines(),
+                         ['date_from', 'Expected an ISO 8601 date or datetime.'])
+
+
+@override_settings(ELASTICSEARCH_INDEX_QUEUE={'ASYNC': True})
+class IndexQueueTestCase(TestCase):
+
+    def setUp(self):
+        self.queue = IndexQueue()
+
+    def test_changes_are_deduplicated(self):
+        with mock.patch.object(self.queue, '_ensure_worker'):
+            self.queue.put(Customer, [1, 2])
+            self.queue.put(Customer, [1])
+            self.queue.put(Customer, [2], action='delete')
+        self.assertEqual(len(self.queue), 2)
+
+        with mock.patch.object(self.queue, '_send') as send:
+            self.queue.flush()
+        send.assert_has_calls([
+            mock.call(Customer, 'index', [1]),
+            mock.call(Customer, 'delete', [2]),
+        ], any_order=True)
+        self.assertEqual(len(self.queue), 0)
+
+    def test_failed_batches_are_requeued(self):
+        with mock.patch.object(self.queue, '_ensure_worker'):
+            self.queue.put(Transaction, [1, 2])
+
+        with mock.patch.object(self.queue, '_send', side_effect=ConnectionError), \
+                self.assertLogs('customers.indexing', level='ERROR'):
+            self.queue.flush()
+        self.assertEqual(len(self.queue), 2)
+
+    def test_failed_rows_are_retried_one_by_one(self):
+        with mock.patch.object(self.queue, '_ensure_worker'):
+            self.queue.put(Transaction, [1, 2, 3])
+
+        def send(model, action, pks):
+            if 2 in pks:
+                raise ValueError(pks)
+
+        with mock.patch.object(self.queue, '_send', side_effect=send) as sender, \
+                self.assertLogs('customers.indexing', level='ERROR'):
+            self.queue.flush()
+        sender.assert_any_call(Transaction, 'index', [1])
+        sender.assert_any_call(Transaction, 'index', [3])
+        self.assertEqual(list(self.queue._pending), [(Transaction, 2, False)])
+
+    @override_settings(ELASTICSEARCH_INDEX_QUEUE={'ASYNC': True, 'MAX_RETRIES': 1})
+    def test_rows_are_dropped_after_max_retries(self):
+        with mock.patch.object(self.queue, '_ensure_worker'):
+            self.queue.put(Transaction, [1])
+
+        with mock.patch.object(self.queue, '_send', side_effect=ValueError), \
+                self.assertLogs('customers.indexing', level='ERROR') as logs:
+            self.queue.flush()
+            self.assertEqual(len(self.queue), 1)
+            self.queue.flush()
+        self.assertEqual(len(self.queue), 0)
+        self.assertIn('Dropped the index of Transaction rows [1] after 1 retries', logs.output[-1])
+
+    @override_settings(ELASTICSEARCH_INDEX_QUEUE={'ASYNC': True, 'MAX_RETRIES': 1})
+    def test_unreachable_elasticsearch_does_not_count_as_a_retry(self):
+        with mock.patch.object(self.queue, '_ensure_worker'):
+            self.queue.put(Transaction, [1])
+
+        with mock.patch.object(self.queue, '_send', side_effect=ConnectionError), \
+                self.assertLogs('customers.indexing', level='ERROR'):
+            for _ in range(3):
+                self.queue.flush()
+        self.assertEqual(len(self.queue), 1)
+
+    def test_related_documents_are_updated_from_the_queue(self):
+        customer = Customer.objects.create(name='milad', email='milad@example.com', phone='09382061246')
+        processor = QueuedSignalProcessor.__new__(QueuedSignalProcessor)
+        with mock.patch.dict(registry._related_models, {Customer: {Transaction}}), \
+                mock.patch.object(registry, 'update_related') as update_related, \
+                mock.patch('customers.indexing.index_queue', self.queue), \
+                mock.patch.object(self.queue, '_ensure_worker'), \
+                self.captureOnCommitCallbacks(execute=True):
+            processor.handle_save(Customer, customer)
+            update_related.assert_not_called()
+        self.assertEqual(len(self.queue), 2)
+
+        with mock.patch.object(registry, 'update_related') as update_related, \
+                override_settings(ELASTICSEARCH_DSL_AUTOSYNC=True), \
+                mock.patch('customers.indexing.registry.get_documents', return_value=[]):
+            self.queue.flush()
+        update_related.assert_called_once_with(customer)
+
+    @override_settings(ELASTICSEARCH_INDEX_QUEUE={'ASYNC': False})
+    def test_synchronous_mode_flushes_on_put(self):
+        with mock.patch.object(self.queue, '_send') as send:
+            self.queue.put(Customer, [1])
+        send.assert_called_once_with(Customer, 'index', [1])
+
+    @override_settings(ELASTICSEARCH_INDEX_QUEUE={'ASYNC': True, 'MAX_LAG': 60})
+    def test_stop_joins_the_worker_and_flushes(self):
+        with mock.patch.object(self.queue, '_send') as send:
+            self.queue.put(Customer, [1])
+            worker = self.queue._worker
+            self.assertTrue(worker.is_alive())
+            self.queue.stop()
+        self.assertFalse(worker.is_alive())
+        send.assert_called_once_with(Customer, 'index', [1])
+
+
+class CustomerSearchTestCase(APITestCase):
+
+    def setUp(self):
+        self.view = CustomerSearchApiView()
+
+    def test_search_excludes_deleted_and_filters_source(self):
+        body = self.view.get_search('milad').to_dict()
+        self.assertIn({'bool': {'must_not': [{'exists': {'field': 'deleted_at'}}]}}, body['query']['bool']['filter'])
+        self.assertEqual(body['_source'], ['id', 'name', 'email', 'phone', 'loyalty_score'])
+
+    def test_search_pagination(self):
+        search = self.view.get_search('milad')
+        body = self.view.paginate_search(search, {'from': '20', 'size': '500'})[0].to_dict()
+        self.assertEqual((body['from'], body['size']), (20, 100))
+
+        body = self.view.paginate_search(search, {'search_after': '1.5,42'})[0].to_dict()
+        self.assertEqual(body['search_after'], [1.5, 42])
+
+    def test_search_beyond_result_window(self):
+        response = self.client.get('/api/customers/search/', {'query': 'milad', 'from': '9995', 'size': '10'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_requires_query(self):
+        response = self.client.get('/api/customers/search/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CustomerSuggestTestCase(APITestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='milad mohammadian',
+            email='milad.mohammadian@gamil.com',
+            phone='09382061246',
+        )
+        self.suggest_url = reverse('customer-suggest')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_suggest_inputs(self):
+        inputs = CustomerDocument().prepare_suggest(self.customer)['input']
+        self.assertEqual(inputs, [
+            'milad mohammadian', 'milad', 'mohammadian', 'milad.mohammadian@gamil.com', '09382061246',
+        ])
+
+        self.customer.deleted_at = timezone.now()
+        self.assertEqual(CustomerDocument().prepare_suggest(self.customer)['input'], [])
+
+    def test_suggest_caches_prefixes(self):
+        suggestions = [{'id': self.customer.id, 'name': 'milad mohammadian', 'email': 'milad.mohammadian@gamil.com'}]
+        with mock.patch.object(CustomerSuggestApiView, 'fetch_suggestions', return_value=suggestions) as fetch:
+            response = self.client.get(self.suggest_url, {'prefix': 'Mil'})
+            self.assertEqual(response.data, suggestions)
+            self.client.get(self.suggest_url, {'prefix': 'mil '})
+        fetch.assert_called_once_with('mil', 5)
+
+    def test_suggest_requires_prefix(self):
+        response = self.client.get(self.suggest_url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CustomerStatsTestCase(APITestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='milad',
+            email='milad.mohammadian@gamil.com',
+            phone='09382061246',
+        )
+        self.other = Customer.objects.create(name='mehrdad', email='mehrdad.azad@gamil.com', phone='09382061246')
+        self.yesterday = timezone.now() - timedelta(days=1)
+        Transaction.objects.create(customer=self.customer, amount='10.00', date=self.yesterday)
+        Transaction.objects.create(customer=self.customer, amount='20.00', date=self.yesterday)
+        self.latest = Transaction.objects.create(customer=self.customer, amount='60.00')
+        self.stats_url = reverse('customers-stats', args=[self.customer.id])
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_customer_stats(self):
+        response = self.client.get(self.stats_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_amount'], '90.00')
+        self.assertEqual(response.data['transaction_count'], 3)
+        self.assertEqual(response.data['average_amount'], '30.00')
+        self.assertEqual(response.data['last_transaction_date'], timezone.localdate().isoformat())
+
+    def test_stats_follow_soft_delete_and_restore(self):
+        self.latest.delete()
+        response = self.client.get(self.stats_url)
+        self.assertEqual(response.data['total_amount'], '30.00')
+        self.assertEqual(response.data['last_transaction_date'], timezone.localdate(self.yesterday).isoformat())
+
+        self.latest.restore()
+        response = self.client.get(self.stats_url)
+        self.assertEqual(response.data['total_amount'], '90.00')
+
+    def test_bulk_stats(self):
+        response = self.client.get(reverse('customers-bulk-stats'), {'ids': f'{self.customer.id},{self.other.id}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['transaction_count'] for row in response.data], [3, 0])
+        self.assertIsNone(response.data[1]['average_amount'])
+
+    def test_apply_is_set_based(self):
+        today = timezone.localdate()
+        deltas = {
+            (self.customer.id, today): (Decimal('5.00'), 1),
+            (self.customer.id, today - timedelta(days=5)): (Decimal('7.00'), 1),
+            (self.other.id, today): (Decimal('3.00'), 2),
+        }
+        # Lookup of the existing days, INSERT of the missing ones in a savepoint and one UPDATE
+        with self.assertNumQueries(5):
+            CustomerDailyStats.apply(deltas)
+        stats = CustomerDailyStats.summarize([self.customer.id, self.other.id])
+        self.assertEqual(stats[0]['total_amount'], Decimal('102.00'))
+        self.assertEqual(stats[0]['transaction_count'], 5)
+        self.assertEqual(stats[1]['total_amount'], Decimal('3.00'))
+        self.assertEqual(stats[1]['transaction_count'], 2)
+
+    def test_rebuild_command(self):
+        CustomerDailyStats.objects.update(total_amount=0, transaction_count=0)
+        call_command('rebuild_customer_stats', stdout=StringIO())
+        response = self.client.get(self.stats_url)
+        self.assertEqual(response.data['total_amount'], '90.00')
+        self.assertEqual(response.data['transaction_count'], 3)
+
+
+class TransactionAggregationsTestCase(APITestCase):
+
+    def setUp(self):
+        self.view = TransactionSearchView()
+
+    def test_aggregation_body(self):
+        params = {'interval': 'week', 'ranges': '-50,50-', 'top': '3', 'percents': '50,95'}
+        body = self.view.add_aggregations(self.view.get_queryset(), params).to_dict()
+        self.assertEqual(body['size'], 0)
+        aggs = body['aggs']
+        self.assertEqual(aggs['date_histogram']['date_histogram']['calendar_interval'], 'week')
+        self.assertEqual(aggs['amount_ranges']['range']['ranges'], [{'to': 50.0}, {'from': 50.0}])
+        self.assertEqual(aggs['top_customers']['terms']['size'], 3)
+        self.assertEqual(aggs['top_customers']['terms']['order'], {'total_amount': 'desc'})
+        self.assertEqual(aggs['percentiles']['percentiles']['percents'], [50.0, 95.0])
+
+    def test_selected_aggregations(self):
+        body = self.view.add_aggregations(self.view.get_queryset(), {'aggs': 'percentiles'}).to_dict()
+        self.assertEqual(list(body['aggs']), ['percentiles'])
+
+        with self.assertRaises(ValueError):
+            self.view.add_aggregations(self.view.get_queryset(), {'aggs': 'histogram'})
+        with self.assertRaises(ValueError):
+            self.view.add_aggregations(self.view.get_queryset(), {'interval': 'hour'})
+        for top in ('0', '-1', '101'):
+            with self.assertRaises(ValueError):
+                self.view.add_aggregations(self.view.get_queryset(), {'aggs': 'top_customers', 'top': top})
+
+    def test_format_aggregations(self):
+        search = self.view.add_aggregations(self.view.get_queryset(), {'aggs': 'amount_ranges,top_customers,percentiles'})
+        response = EsResponse(search, {
+            'hits': {'total': {'value': 3, 'relation': 'eq'}, 'hits': []},
+            'aggregations': {
+                'amount_ranges': {'buckets': [
+                    {'key': '*-100.0', 'to': 100.0, 'doc_count': 2, 'total_amount': {'value': 30.0}},
+                ]},
+                'top_customers': {'buckets': [
+                    {'key': 7, 'doc_count': 2, 'total_amount': {'value': 130.0}},
+                ]},
+                'percentiles': {'values': {'50.0': 20.0}},
+            },
+        })
+        data = self.view.format_aggregations(response)
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['amount_ranges'], [{'from': None, 'to': 100.0, 'count': 2, 'total_amount': 30.0}])
+        self.assertEqual(data['top_customers'], [{'customer': 7, 'count': 2, 'total_amount': 130.0}])
+        self.assertEqual(data['percentiles'], {'50.0': 20.0})
+
+
+class ReindexCommandTestCase(TestCase):
+
+    def test_split_id_ranges(self):
+        self.assertEqual(split_id_ranges(1, 10, 3), [(1, 5), (5, 9), (9, 11)])
+        self.assertEqual(split_id_ranges(5, 6, 8), [(5, 6), (6, 7)])
+        self.assertEqual(split_id_ranges(None, None, 4), [])
+
+    def test_unknown_index(self):
+        with self.assertRaises(CommandError):
+            call_command('reindex_search', index=['orders'], stdout=StringIO())
+
+    def test_catch_up_rows(self):
+        old = Customer.objects.create(name='old', email='old@gamil.com', phone='09382061246')
+        Customer.all_objects.filter(pk=old.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        since = timezone.now() - timedelta(minutes=5)
+        changed = Customer.objects.create(name='changed', email='changed@gamil.com', phone='09382061246')
+        new = Customer.objects.create(name='new', email='new@gamil.com', phone='09382061246')
+        Customer.all_objects.filter(pk__in=[changed.pk, new.pk]).update(updated_at=since - timedelta(hours=1))
+        Customer.all_objects.filter(pk=changed.pk).update(deleted_at=timezone.now())
+
+        rows = changed_since(Customer, since, max_id=changed.pk)
+        self.assertEqual(sorted(rows.values_list('pk', flat=True)), [changed.pk, new.pk])
+
+    def test_catch_up_transaction_edits_and_restores(self):
+        customer = Customer.objects.create(name='milad', email='milad@gamil.com', phone='09382061246')
+        edited, restored, untouched = Transaction.objects.bulk_create(
+            Transaction(customer=customer, amount='10.00') for _ in range(3))
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Transaction.all_objects.update(updated_at=an_hour_ago)
+        Transaction.all_objects.filter(pk=restored.pk).update(deleted_at=an_hour_ago)
+        since = timezone.now() - timedelta(minutes=5)
+
+        edited.description = 'edited'
+        edited.save()
+        Transaction.all_objects.filter(pk=restored.pk).restore()
+
+        rows = changed_since(Transaction, since, max_id=untouched.pk)
+        self.assertEqual(sorted(rows.values_list('pk', flat=True)), [edited.pk, restored.pk])
+
+    def test_failed_load_deletes_the_new_index(self):
+        client = mock.MagicMock()
+        with mock.patch.object(CustomerDocument, '_get_connection', return_value=client), \
+                mock.patch('customers.management.commands.reindex_search.Command.load', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            call_command('reindex_search', index=['customers'], stdout=StringIO(), stderr=StringIO())
+        created = client.indices.create.call_args.kwargs['index']
+        client.indices.delete.assert_called_once_with(index=created, ignore_unavailable=True)
+        client.indices.update_aliases.assert_not_called()
+
+
+class BulkSoftDeleteTestCase(APITestCase):
+
+    def setUp(self):
+        self.customers = Customer.objects.bulk_create(
+            Customer(name=f'customer {i}', email=f'customer{i}@gamil.com', phone='09382061246')
+            for i in range(3)
+        )
+        for customer in self.customers:
+            Transaction.objects.create(customer=customer, amount='10.00')
+        self.ids = [customer.id for customer in self.customers[:2]]
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_queryset_soft_delete_and_restore(self):
+        cache.set(f'customer_{self.ids[0]}', {'name': 'stale'})
+        # A constant number of queries: the customer UPDATE, then the cascaded transaction UPDATE,
+        # their rollup deltas and ids, each in a savepoint
+        with self.assertNumQueries(12):
+            self.assertEqual(Customer.objects.filter(id__in=self.ids).soft_delete(), 2)
+        self.assertEqual(Customer.objects.count(), 1)
+        self.assertEqual(Customer.all_objects.count(), 3)
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertIsNone(cache.get(f'customer_{self.ids[0]}'))
+
+        self.assertEqual(Customer.all_objects.filter(id__in=self.ids).restore(), 2)
+        self.assertEqual(Customer.objects.count(), 3)
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_restore_keeps_transactions_deleted_earlier(self):
+        customer_id = self.ids[0]
+        earlier = Transaction.objects.create(customer_id=customer_id, amount='20.00')
+        deleted = Transaction.objects.create(customer_id=customer_id, amount='5.00')
+        deleted.delete()
+
+        Customer.objects.filter(id=customer_id).soft_delete()
+        self.assertEqual(CustomerDailyStats.summarize([customer_id])[0]['transaction_count'], 0)
+        Customer.all_objects.filter(id=customer_id).restore()
+
+        self.assertEqual(sorted(Transaction.objects.filter(customer_id=customer_id).values_list('amount', flat=True)),
+                         [Decimal('10.00'), Decimal('20.00')])
+        self.assertIsNotNone(Transaction.all_objects.get(pk=deleted.pk).deleted_at)
+        stats = CustomerDailyStats.summarize([customer_id])[0]
+        self.assertEqual((stats['total_amount'], stats['transaction_count']), (Decimal('30.00'), 2))
+
+        customer = Customer.objects.get(id=customer_id)
+        customer.delete()
+        customer.restore()
+        self.assertEqual(Transaction.objects.filter(customer_id=customer_id).count(), 2)
+        self.assertIsNone(Transaction.all_objects.get(pk=earlier.pk).deleted_at)
+
+    def test_soft_delete_invalidates_cascaded_transactions(self):
+        transaction = Transaction.objects.get(customer_id=self.ids[0])
+        detail_url = reverse('transactions-detail', args=[transaction.id])
+        self.assertEqual(self.client.get(detail_url).status_code, status.HTTP_200_OK)
+
+        with mock.patch('customers.signals.index_queue.put_on_commit') as put_on_commit:
+            Customer.objects.filter(id__in=self.ids).soft_delete()
+        put_on_commit.assert_any_call(Transaction, mock.ANY)
+        self.assertEqual(self.client.get(detail_url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_queryset_delete_is_soft(self):
+        Transaction.objects.filter(customer_id=self.ids[0]).delete()
+        self.assertEqual(Transaction.all_objects.count(), 3)
+        self.assertEqual(CustomerDailyStats.summarize([self.ids[0]])[0]['transaction_count'], 0)
+
+        Transaction.all_objects.filter(customer_id=self.ids[0]).restore()
+        self.assertEqual(CustomerDailyStats.summarize([self.ids[0]])[0]['transaction_count'], 1)
+
+    def test_bulk_delete_endpoint(self):
+        response = self.client.post(reverse('customers-bulk-delete'), {'ids': self.ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted'], 2)
+
+        response = self.client.post(reverse('customers-bulk-restore'), {'ids': self.ids}, format='json')
+        self.assertEqual(response.data['restored'], 2)
+
+        response = self.client.post(reverse('customers-bulk-delete'), {'ids': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ArchiveTransactionsTestCase(APITestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='milad',
+            email='milad.mohammadian@gamil.com',
+            phone='09382061246',
+        )
+        self.old = Transaction.objects.create(
+            customer=self.customer, amount='10.00', date=timezone.now() - timedelta(days=800))
+        self.deleted = Transaction.objects.create(customer=self.customer, amount='20.00')
+        self.deleted.delete()
+        self.recent = Transaction.objects.create(customer=self.customer, amount='30.00')
+        self.list_url = reverse('transactions-list')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_archive_transactions(self):
+        call_command('archive_transactions', months=24, batch_size=1, stdout=StringIO())
+        self.assertEqual(list(Transaction.all_objects.values_list('id', flat=True)), [self.recent.id])
+        self.assertEqual(
+            sorted(ArchivedTransaction.objects.values_list('id', flat=True)), [self.old.id, self.deleted.id])
+
+        response = self.client.get(self.list_url)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.recent.id])
+
+        # Soft-deleted rows stay hidden in the archive
+        response = self.client.get(self.list_url, {'archive': 'true'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.old.id])
+
+        response = self.client.get(reverse('transactions-detail', args=[self.old.id]), {'archive': 'true'})
+        self.assertEqual(response.data['amount'], '10.00')
+        response = self.client.get(reverse('transactions-detail', args=[self.deleted.id]), {'archive': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rebuilt_stats_include_archived_transactions(self):
+        call_command('archive_transactions', months=24, stdout=StringIO())
+        call_command('rebuild_customer_stats', stdout=StringIO())
+        stats = CustomerDailyStats.summarize([self.customer.id])[0]
+        self.assertEqual((stats['total_amount'], stats['transaction_count']), (Decimal('40.00'), 2))
+
+
+class CacheStampedeTestCase(APITestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='milad',
+            email='milad.mohammadian@gamil.com',
+            phone='09382061246',
+        )
+        self.cache_key = f'customer_{self.customer.id}'
+        self.detail_url = reverse('customers-detail', args=[self.customer.id])
+
+    def tearDown(self):
+        cache.clear()
+
+    def expire_entry(self):
+        entry = cache.get(self.cache_key)
+        entry['expires'] = 0
+        entry['data'] = dict(entry['data'], name='stale')
+        cache.set(self.cache_key, entry)
+
+    def test_stale_entry_served_while_locked(self):
+        self.client.get(self.detail_url)
+        self.expire_entry()
+        cache.add(f'{self.cache_key}_lock', 1)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url)
+        self.assertEqual(response.data['name'], 'stale')
+
+    def test_expired_entry_recomputed_by_lock_holder(self):
+        self.client.get(self.detail_url)
+        self.expire_entry()
+
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.data['name'], 'milad')
+        self.assertGreater(cache.get(self.cache_key)['expires'], 0)
+        self.assertIsNone(cache.get(f'{self.cache_key}_lock'))
+
+    def test_cold_miss_computes_when_lock_is_not_released(self):
+        cache.add(f'{self.cache_key}_lock', 1)
+        with mock.patch('customers.views.CustomerViewSet.cache_lock_wait', 0):
+            response = self.client.get(self.detail_url)
+        self.assertEqual(response.data['name'], 'milad')
+
+    def test_expiry_is_jittered(self):
+        with mock.patch('customers.cache.cache.set') as cache_set:
+            for _ in range(20):
+                cache.delete(self.cache_key)
+                self.client.get(self.detail_url)
+        timeouts = {call.kwargs['timeout'] for call in cache_set.call_args_list if call.args[0] == self.cache_key}
+        self.assertGreater(len(timeouts), 1)
+        for timeout in timeouts:
+            self.assertTrue(270 + 60 <= timeout <= 330 + 60)
+
+
+@override_settings(LOCAL_DETAIL_CACHE={'ENABLED': True, 'MAX_SIZE': 2, 'TIMEOUT': 5})
+class LocalCacheTestCase(APITestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='milad',
+            email='milad.mohammadian@gamil.com',
+            phone='09382061246',
+        )
+        self.detail_url = reverse('customers-detail', args=[self.customer.id])
+
+    def tearDown(self):
+        local_hits.flush()
+        cache.clear()
+        local_cache.clear()
+
+    def test_lru_eviction_and_ttl(self):
+        local = LocalCache()
+        local.set('a', 1)
+        local.set('b', 2)
+        local.get('a')
+        local.set('c', 3)
+        self.assertEqual((local.get('a'), local.get('b'), local.get('c')), (1, None, 3))
+
+        with mock.patch('customers.cache.time.monotonic', return_value=time.monotonic() + 10):
+            self.assertIsNone(local.get('a'))
+
+    def test_listener_subscribes_before_the_tier_is_filled(self):
+        messages = Queue()
+        connection = mock.Mock()
+        connection.pubsub.return_value.listen.side_effect = lambda: iter(messages.get, None)
+        local = LocalCache()
+        with mock.patch('customers.cache._redis_connection', return_value=connection):
+            local.set('a', 1)
+            local.set('b', 2)
+            time.sleep(0.05)
+            self.assertEqual((local.get('a'), local.get('b')), (1, 2))
+
+            messages.put({'data': json.dumps(['a'])})
+            time.sleep(0.05)
+            self.assertEqual((local.get('a'), local.get('b')), (None, 2))
+
+    def test_nothing_is_cached_without_a_subscription(self):
+        local = LocalCache()
+        local.subscribe_timeout = 0.05
+        with mock.patch('customers.cache._redis_connection', return_value=mock.Mock()), \
+                mock.patch.object(LocalCache, '_listen'):
+            local.set('a', 1)
+        self.assertIsNone(local.get('a'))
+
+    def test_retrieve_served_from_local_tier(self):
+        self.client.get(self.detail_url)
+        with mock.patch('customers.cache.cache.get') as cache_get, self.assertNumQueries(0):
+            response = self.client.get(self.detail_url)
+        self.assertEqual(response.data['name'], 'milad')
+        self.assertNotIn(mock.call(f'customer_{self.customer.id}'), cache_get.call_args_list)
+
+    def test_local_hits_are_counted_in_process(self):
+        self.client.get(self.detail_url)
+        local_hits.flush()
+        with mock.patch('customers.cache.cache.incr') as incr:
+            self.client.get(self.detail_url)
+            self.client.get(self.detail_url)
+        incr.assert_not_called()
+        self.assertEqual(get_cache_stats('customers')['hits'], 2)
+
+        with override_settings(LOCAL_DETAIL_CACHE={'ENABLED': True, 'STATS_FLUSH_INTERVAL': 0}):
+            self.client.get(self.detail_url)
+        self.assertEqual(local_hits.pending('customers'), 0)
+        self.assertEqual(cache.get('customers_cache_hits'), 3)
+
+    def test_update_invalidates_every_process(self):
+        self.client.get(self.detail_url)
+        data = {'name': 'mehrdad', 'email': 'mehrdad.azad@gamil.com', 'phone': '09382061246'}
+        with mock.patch.object(LocalCache, 'publish') as publish:
+            self.client.put(self.detail_url, data)
+        publish.assert_called_with([f'customer_{self.customer.id}'])
+        self.assertIsNone(local_cache.get(f'customer_{self.customer.id}'))
+        self.assertEqual(self.client.get(self.detail_url).data['name'], 'mehrdad')
+
+
+class RenderedCacheTestCase(APITestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='milad',
+            email='milad.mohammadian@gamil.com',
+            phone='09382061246',
+        )
+        Transaction.objects.bulk_create(
+            Transaction(customer=self.customer, amount='10.00', description='x' * 100) for _ in range(10))
+        self.list_url = reverse('transactions-list')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_hit_serves_rendered_bytes(self):
+        first = self.client.get(self.list_url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.list_url)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second['Content-Type'], 'application/json')
+        self.assertEqual(second.json(), json.loads(first.content))
+
+    def test_large_pages_are_compressed(self):
+        with mock.patch('customers.cache.cache.set', wraps=cache.set) as cache_set:
+            self.client.get(self.list_url)
+        entry = next(call.args[1] for call in cache_set.call_args_list if '_list_' in call.args[0])
+        self.assertTrue(entry['compressed'])
+        self.assertEqual(len(self.client.get(self.list_url).json()['results']), 10)
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.list_url)['ETag']
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=f'W/{etag}')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ConditionalRequestTestCase(APITestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='milad',
+            email='milad.mohammadian@gamil.com',
+            phone='09382061246',
+        )
+        self.list_url = reverse('customers-list')
+        self.detail_url = reverse('customers-detail', args=[self.customer.id])
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_not_modified_before_serialization(self):
+        response = self.client.get(self.detail_url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        cache.clear()
+
+        # Only the validator query runs, the row is neither fetched nor serialized
+        with self.assertNumQueries(1):
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        # Served from the cache, the stored validators are replayed
+        self.client.get(self.detail_url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_update_changes_validators(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        data = {'name': 'mehrdad', 'email': 'mehrdad.azad@gamil.com', 'phone': '09382061246'}
+        self.client.put(self.detail_url, data)
+
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_validators(self):
+        other = Customer.objects.create(name='mehrdad', email='mehrdad.azad@gamil.com', phone='09382061246')
+        response = self.client.get(self.list_url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        response = self.client.get(self.list_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Removing a row changes the count even though no updated_at moved
+        Customer.objects.filter(pk=other.pk).soft_delete()
+        cache.clear()
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+
+    def test_customer_update_changes_transaction_validators(self):
+        transaction = Transaction.objects.create(customer=self.customer, amount='10.00')
+        urls = [reverse('transactions-detail', args=[transaction.id]), reverse('transactions-list')]
+        etags = [self.client.get(url)['ETag'] for url in urls]
 
+        data = {'name': 'mehrdad', 'email': 'mehrdad.azad@gamil.com', 'phone': '09382061246'}
+        self.client.put(self.detail_url, data)
 
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('"name":"mehrdad"', response.content.decode())
+
+    def test_transaction_list_validators_do_not_join(self):
+        Transaction.objects.create(customer=self.customer, amount='10.00')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('transactions-list'))
+        validator_query = next(query['sql'] for query in queries if 'MAX(' in query['sql'])
+        self.assertNotIn('JOIN', validator_query)
+
+    def test_missing_row_is_404(self):
+        response = self.client.get(reverse('customers-detail', args=[0]), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AsyncViewsTestCase(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='milad',
+            email='milad.mohammadian@gamil.com',
+            phone='09382061246',
+        )
+        Transaction.objects.bulk_create(
+            Transaction(customer=self.customer, amount='10.00', date=timezone.now() - timedelta(days=i))
+            for i in range(15)
+        )
+        self.factory = APIRequestFactory()
+
+    def tearDown(self):
+        cache.clear()
+
+    async def get(self, view, path, data=None, **kwargs):
+        request = self.factory.get(path, data, HTTP_IF_NONE_MATCH=kwargs.pop('etag', ''))
+        response = await view(request, **kwargs)
+        return response.render() if hasattr(response, 'render') else response
+
+    async def test_list_matches_sync_view(self):
+        sync_response = await sync_to_async(self.client.get)(reverse('transactions-list'), {'limit': 5})
+        cache.clear()
+
+        view = AsyncTransactionViewSet.as_view({'get': 'list'})
+        response = await self.get(view, '/api/transactions/', {'limit': 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), sync_response.json())
+
+        # Served from the cache entry the first request stored
+        etag = response['ETag']
+        response = await self.get(view, '/api/transactions/', {'limit': 5})
+        self.assertEqual(json.loads(response.content)['count'], 15)
+        self.assertEqual(get_cache_stats('transactions')['hits'], 1)
+
+        # Clearing the cache started a new generation; both views validate on it
+        sync_response = await sync_to_async(self.client.get)(reverse('transactions-list'), {'limit': 5})
+        self.assertEqual(sync_response['ETag'], etag)
+
+    async def test_keyset_pagination(self):
+        view = AsyncTransactionViewSet.as_view({'get': 'list'})
+        response = await self.get(view, '/api/transactions/', {'pagination': 'cursor', 'limit': 10})
+        first_page = json.loads(response.content)
+        self.assertEqual(len(first_page['results']), 10)
+
+        cursor = first_page['next'].split('cursor=')[1].split('&')[0]
+        response = await self.get(view, '/api/transactions/', {'cursor': cursor, 'limit': 10})
+        second_page = json.loads(response.content)
+        self.assertEqual(len(second_page['results']), 5)
+        self.assertIsNone(second_page['next'])
+
+    async def test_retrieve(self):
+        view = AsyncCustomerViewSet.as_view({'get': 'retrieve'})
+        path = f'/api/customers/{self.customer.id}/'
+        response = await self.get(view, path, pk=str(self.customer.id))
+        self.assertEqual(response.data['name'], 'milad')
+
+        response = await self.get(view, path, pk=str(self.customer.id), etag=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = await self.get(view, '/api/customers/0/', pk='0')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_unknown_customer_transactions(self):
+        view = AsyncCustomerTransactionViewSet.as_view({'get': 'list'})
+        response = await self.get(view, '/api/customers/0/transactions/', customer_id=0)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        path = f'/api/customers/{self.customer.id}/transactions/'
+        response = await self.get(view, path, customer_id=self.customer.id)
+        self.assertEqual(len(json.loads(response.content)['results']), 10)
+
+    async def test_sync_actions_run_in_a_thread(self):
+        view = AsyncCustomerViewSet.as_view({'delete': 'destroy'})
+        request = self.factory.delete(f'/api/customers/{self.customer.id}/')
+        response = await view(request, pk=str(self.customer.id))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(await Customer.objects.filter(pk=self.customer.pk).aexists())
+
+    async def test_search_uses_async_client(self):
+        client = mock.Mock()
+        client.search = mock.AsyncMock(return_value=mock.Mock(body={
+            'hits': {'total': {'value': 1}, 'hits': [{
+                '_index': 'customers', '_id': '1', '_score': 1.0, 'sort': [1.0, 1],
+                '_source': {'id': 1, 'name': 'milad', 'email': 'milad.mohammadian@gamil.com'},
+            }]},
+        }))
+        view = AsyncCustomerSearchApiView.as_view()
+        with mock.patch('customers.views.get_async_elasticsearch', return_value=client):
+            response = await self.get(view, '/api/customers/search/', {'query': 'milad', 'size': 1})
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['search_after'], '1.0,1')
+        self.assertEqual(client.search.call_args.kwargs['index'], 'customers')
+
+        response = await self.get(view, '/api/customers/search/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ConnectionPoolChecksTestCase(TestCase):
+    def test_persistent_connections_warnings(self):
+        database = {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': False}
+        with mock.patch.dict(settings.DATABASES['default'], database), override_settings(ASYNC_VIEWS=True):
+            ids = [message.id for message in check_connection_pools(None)]
+        self.assertEqual(ids, ['customers.W001', 'customers.W002'])
+        self.assertEqual(check_connection_pools(None), [])
+
+    def test_pool_report(self):
+        caches = {'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': 'redis://redis:6379/1',
+            'OPTIONS': {'SOCKET_TIMEOUT': 1.0, 'CONNECTION_POOL_KWARGS': {'max_connections': 20}},
+        }}
+        elasticsearch = {'default': {'hosts': ['http://es1:9200', 'http://es2:9200'], 'connections_per_node': 4}}
+        with override_settings(CACHES=caches, ELASTICSEARCH_DSL=elasticsearch):
+            report = connection_pool_report()
+            self.assertEqual(get_redis_pool_config(),
+                             ('redis://redis:6379/1', {'max_connections': 20, 'socket_timeout': 1.0}))
+        self.assertEqual(report['redis']['max_connections'], 20)
+        self.assertEqual(report['elasticsearch']['nodes'], 2)
+        self.assertEqual(report['elasticsearch']['connections_per_node'], 4)
+
+
+class BenchmarkTestCase(TestCase):
+    def test_generate_dataset(self):
+        summary = generate_dataset(customers=20, transactions=400, seed=1)
+
+        self.assertEqual(summary['customers'], 20)
+        self.assertEqual(Transaction.objects.count(), 400)
+        # Activity is skewed towards a few customers
+        self.assertGreater(summary['busiest_customer_transactions'], 400 / 20 * 3)
+        customer = Customer.objects.order_by('-loyalty_score').first()
+        self.assertEqual(customer.loyalty_score, customer.transactions.count())
+        self.assertEqual(CustomerDailyStats.summarize([customer.id])[0]['transaction_count'],
+                         customer.transactions.count())
+
+    def test_run_benchmarks(self):
+        generate_dataset(customers=10, transactions=50)
+
+        results = run_benchmarks(repeat=2, names=['customer_list_cold', 'customer_list_cached', 'customer_search'])
+
+        self.assertEqual(set(results['results']), {'customer_list_cold', 'customer_list_cached', 'customer_search'})
+        self.assertEqual(results['results']['customer_list_cached']['queries'], 0)
+        self.assertGreater(results['results']['customer_list_cold']['queries'], 0)
+        self.assertEqual(results['results']['customer_search']['queries'], 0)
+        json.dumps(results)
+
+        slower = {'results': {name: {**result, 'p50_ms': result['p50_ms'] * 2}
+                              for name, result in results['results'].items()}}
+        self.assertTrue(all(change == 100.0 for *_, change in compare_results(results, slower)))
+
+
+class RequestTimingTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        timing_registry.clear()
+        Customer.objects.create(name='milad', email='milad@example.com', phone='09120000000')
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('customers-list'))
+
+        timings = dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+        self.assertIn('db', timings)
+        self.assertIn('app', timings)
+        self.assertIn('total', timings)
+        self.assertNotIn('es', timings)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('customers-list'))
+        self.client.get(reverse('customers-list'))
+
+        response = self.client.get(reverse('metrics'))
+
+        body = response.content.decode()
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('customers_request_duration_seconds_count{view="customers-list",method="GET"} 2', body)
+        self.assertIn('customers_request_duration_seconds_bucket{view="customers-list",method="GET",le="+Inf"} 2',
+                      body)
+        self.assertIn('customers_backend_duration_seconds_count{view="customers-list",method="GET",backend="db"} 2',
+                      body)
+
+    def test_sampling(self):
+        with override_settings(REQUEST_TIMING={'SAMPLE_RATE': 0}):
+            response = self.client.get(reverse('customers-list'))
+            self.assertEqual(check_request_timing(None), [])
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('customers-list', timing_registry.render())
+
+        with override_settings(REQUEST_TIMING={'SAMPLE_RATE': 2}):
+            self.assertEqual([message.id for message in check_request_timing(None)], ['customers.E003'])
+
+    def test_nested_calls_are_counted_once(self):
+        from .instrumentation import RequestTimings, _current
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            with timed('cache'):
+                with timed('cache'):
+                    pass
+            with timed('es'):
+                pass
+        finally:
+            _current.reset(token)
+        with timed('cache'):
+            pass
+
+        self.assertEqual(timings.counts, {'db': 0, 'cache': 1, 'es': 1})
+
+
+@override_settings(SLOW_LOG={'ENABLED': True, 'QUERY_THRESHOLD': 0, 'SEARCH_THRESHOLD': 0, 'MAX_ENTRIES': 5})
+class SlowLogTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        slow_log.clear()
+        self.customer = Customer.objects.create(name='milad', email='milad@example.com', phone='09120000000')
+
+    def test_slow_queries_are_explained(self):
+        self.client.get(reverse('customers-detail', args=[self.customer.id]))
+
+        entries = slow_log.entries('query')
+        self.assertTrue(entries)
+        self.assertLessEqual(len(entries), 5)
+        select = next(entry for entry in entries if 'FROM "customers_customer"' in entry['sql'])
+        self.assertEqual(select['view'], 'customers-detail')
+        self.assertTrue(select['plan'])
+
+    def test_only_customers_views_are_logged(self):
+        with override_settings(SLOW_LOG={'ENABLED': False}):
+            self.client.get(reverse('customers-list'))
+        Customer.objects.count()
+
+        self.assertEqual(slow_log.entries(), [])
+
+    def test_slow_searches(self):
+        token = _view.set('customer-search')
+        try:
+            record_slow_search('/customers/_search?typed_keys=true', b'{"query": {"match_all": {}}}', b'{"took": 42}', 0.5)
+            record_slow_search('/customers/_doc/1', None, b'{}', 0.5)
+        finally:
+            _view.reset(token)
+        record_slow_search('/customers/_search', b'{}', b'{"took": 1}', 0.5)
+
+        entries = slow_log.entries('search')
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['index'], 'customers')
+        self.assertEqual(entries[0]['took_ms'], 42)
+        self.assertEqual(entries[0]['body'], {'query': {'match_all': {}}})
+
+    def test_admin_page_and_command(self):
+        from django.contrib.auth.models import User
+
+        self.client.get(reverse('customers-list'))
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+        response = self.client.get(reverse('slow-log'), {'kind': 'query'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, 'customers-list')
+
+        out = StringIO()
+        call_command('slow_log', '--kind', 'query', '--json', '--clear', stdout=out)
+        self.assertEqual(json.loads(out.getvalue().splitlines()[0])['kind'], 'query')
+        self.assertEqual(slow_log.entries(), [])
+
+
+class IndexPlanTestCase(APITestCase):
+    def test_hot_queries_use_their_indexes(self):
+        out = StringIO()
+        call_command('check_indexes', stdout=out)
+        self.assertNotIn('FAIL', out.getvalue())
+
+    def test_email_unique_among_active_customers(self):
+        customer = Customer.objects.create(name='milad', email='milad@example.com', phone='09120000000')
+        data = {'name': 'milad', 'email': 'milad@example.com', 'phone': '09120000000'}
+
+        response = self.client.post(reverse('customers-list'), data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', response.data)
+
+        customer.delete()
+        response = self.client.post(reverse('customers-list'), data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.post(reverse('customers-bulk-restore'), {'ids': [customer.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Customer.objects.filter(email='milad@example.com').count(), 1)
+
+
+class CustomerTransactionsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name='milad', email='milad@example.com', phone='09120000000')
+        self.other = Customer.objects.create(name='mehrdad', email='mehrdad@example.com', phone='09120000001')
+        now = timezone.now()
+        self.transactions = Transaction.objects.bulk_create(
+            Transaction(customer=self.customer, amount=Decimal(10 * (i + 1)), date=now - timedelta(days=i))
+            for i in range(5)
+        )
+        Transaction.objects.create(customer=self.other, amount=Decimal('99.00'))
+        self.url = reverse('customer-create-transaction', args=[self.customer.id])
+
+    def test_list_newest_first_with_keyset_pages(self):
+        response = self.client.get(self.url, {'limit': 3})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertEqual([row['id'] for row in response.data['results']],
+                         [t.id for t in self.transactions[:3]])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['id'] for row in response.data['results']],
+                         [t.id for t in self.transactions[3:]])
+        self.assertIsNone(response.data['next'])
+
+    def test_filters_and_ordering(self):
+        response = self.client.get(self.url, {'amount_min': '20', 'amount_max': '40', 'ordering': 'date'})
+        self.assertEqual([row['amount'] for row in response.data['results']], ['40.00', '30.00', '20.00'])
+
+        date_from = (timezone.now() - timedelta(days=1, hours=12)).isoformat()
+        response = self.client.get(self.url, {'date_from': date_from})
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.assertEqual(self.client.get(self.url, {'ordering': 'amount'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'amount_min': 'ten'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_or_deleted_customer_is_not_found(self):
+        url = reverse('customer-create-transaction', args=[0])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.post(url, {'amount': '5.00'}).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        self.client.delete(reverse('customers-detail', args=[self.customer.id]))
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.post(reverse('customers-bulk-restore'), {'ids': [self.customer.id]}, format='json')
+        self.assertEqual(len(self.client.get(self.url).json()['results']), 5)
+
+    def test_cache_is_per_customer(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.client.get(self.url).json()['results']), 5)
+
+        other_url = reverse('customer-create-transaction', args=[self.other.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(other_url, {'amount': '5.00'})
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'amount': '5.00'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(self.client.get(self.url).json()['results']), 6)
 
+        with self.captureOnCommitCallbacks(execute=True):
+            self.transactions[0].delete()
+        self.assertEqual(len(self.client.get(self.url).json()['results']), 5)
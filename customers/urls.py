@@ -1,20 +1,42 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework.routers import DefaultRouter
+from .instrumentation import metrics
 from .views import (
+    AsyncCustomerSearchApiView,
+    AsyncCustomerTransactionViewSet,
+    AsyncCustomerViewSet,
+    AsyncTransactionViewSet,
+    CustomerTransactionViewSet,
     CustomerViewSet,
     CustomerSearchApiView,
+    CustomerSuggestApiView,
     TransactionViewSet,
     TransactionSearchView)
 
+if settings.ASYNC_VIEWS:
+    customer_viewset, customer_search_view, transaction_viewset, customer_transaction_viewset = (
+        AsyncCustomerViewSet, AsyncCustomerSearchApiView, AsyncTransactionViewSet, AsyncCustomerTransactionViewSet)
+else:
+    customer_viewset, customer_search_view, transaction_viewset, customer_transaction_viewset = (
+        CustomerViewSet, CustomerSearchApiView, TransactionViewSet, CustomerTransactionViewSet)
+
 router = DefaultRouter()
-router.register(r'customers', CustomerViewSet, basename='customers')
-router.register(r'transactions', TransactionViewSet, basename='transactions')
+router.register(r'customers', customer_viewset, basename='customers')
+router.register(r'transactions', transaction_viewset, basename='transactions')
 
-urlpatterns = [path("customers/search/", CustomerSearchApiView.as_view()),
+urlpatterns = [path('metrics/', metrics, name='metrics'),
+               path("customers/search/", customer_search_view.as_view()),
+               path("customers/suggest/", CustomerSuggestApiView.as_view(), name='customer-suggest'),
                path('transactions/search/', TransactionSearchView.as_view({'get': 'list'}),
                     name='transaction-search'),
+               path('transactions/search/aggregations/',
+                    TransactionSearchView.as_view({'get': 'aggregations'}), name='transaction-aggregations'),
                path('customers/<int:customer_id>/transactions/',
-                    TransactionViewSet.as_view({'post': 'create'}), name='customer-create-transaction'),
+                    customer_transaction_viewset.as_view({'get': 'list', 'post': 'create'}),
+                    name='customer-create-transaction'),
+               path('customers/<int:customer_id>/transactions/bulk/',
+                    customer_transaction_viewset.as_view({'post': 'bulk'}), name='customer-bulk-create-transactions'),
                ]
 
 urlpatterns += router.urls
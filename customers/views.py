@@ -1,3 +1,5 @@
+from collections import Counter
+from urllib.parse import quote
 from rest_framework.viewsets import (
     ModelViewSet, 
     GenericViewSet)
@@ -6,7 +8,9 @@ from rest_framework.mixins import (
     CreateModelMixin, 
     RetrieveModelMixin)
 from rest_framework.views import APIView
+from rest_framework.decorators import action
 from rest_framework import status
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from elasticsearch_dsl import Q
 from django_elasticsearch_dsl_drf.filter_backends import (
@@ -14,113 +18,288 @@ from django_elasticsearch_dsl_drf.filter_backends import (
     FilteringFilterBackend,
     OrderingFilterBackend)
 from django_elasticsearch_dsl_drf.viewsets import DocumentViewSet
+from elasticsearch_dsl.response import Response as SearchResponse
 from django.core.cache import cache
+from django.db import IntegrityError, transaction as db_transaction
+from .asynchronous import AsyncAPIViewMixin, AsyncReadModelMixin, get_async_elasticsearch
+from .cache import (
+    CachedResponseMixin,
+    bump_generation,
+    customer_transactions_namespace,
+    delete_detail_keys,
+    reset_generations)
+from .conditional import ConditionalRequestMixin
+from .export import (
+    CSVRenderer,
+    NDJSONRenderer,
+    date_range_filter,
+    decimal_range_filter,
+    id_list_filter,
+    stream_export)
+from .indexing import index_queue
+from .optimization import READ_ACTIONS, OptimizedQuerysetMixin
+from .pagination import KeysetPaginationMixin
 from .models import (
+    ArchivedTransaction,
     Customer, 
-    Transaction)
+    CustomerDailyStats,
+    Transaction,
+    rollup_deltas)
 from .serializers import (
+    ArchivedTransactionSerializer,
+    BulkTransactionSerializer,
+    CustomerIdsSerializer,
     CustomerSerializer,
+    CustomerStatsSerializer,
     CustomerDocumentSerializer,
     TransactionSerializer,
     TransactionDocumentSerializer)
 from .documents import CustomerDocument
 from .documents import TransactionDocument
-from .signals import update_customer_loyalty_score
+from .signals import (
+    increment_loyalty_scores,
+    update_customer_loyalty_score)
 
 
-class CustomerViewSet(ModelViewSet):
+class CustomerViewSet(CachedResponseMixin,
+                      ConditionalRequestMixin,
+                      OptimizedQuerysetMixin,
+                      KeysetPaginationMixin,
+                      ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
-
-    def list(self, request, *args, **kwargs):
-        cache_key = 'customers_list'
-        cached_data = cache.get(cache_key)
-
-        if cached_data:
-            return Response(cached_data)
-
-        response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, timeout=300)  # Cache for 5 minutes
-
-        return response
-
-    def retrieve(self, request, *args, **kwargs):
-        cache_key = f'customer_{kwargs["pk"]}'
-        cached_data = cache.get(cache_key)
-
-        if cached_data:
-            return Response(cached_data)
-
-        response = super().retrieve(request, *args, **kwargs)
-        cache.set(cache_key, response.data, timeout=300)  # Cache for 5 minutes
-
-        return response
+    last_modified_field = 'updated_at'
+    cache_namespace = 'customers'
+    cache_detail_key = 'customer_{pk}'
+    keyset_ordering = ('created_at', 'id')
+    export_fields = {
+        'id': 'id',
+        'name': 'name',
+        'email': 'email',
+        'phone': 'phone',
+        'loyalty_score': 'loyalty_score',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    }
 
     def create(self, request, *args, **kwargs):
         response = super().create(request, *args, **kwargs)
-        cache.delete('customers_list')  # Invalidate list cache
+        self.invalidate_list_cache()
         return response
 
     def update(self, request, *args, **kwargs):
         response = super().update(request, *args, **kwargs)
-        cache.delete('customers_list')  # Invalidate list cache
-        cache.delete(f'customer_{kwargs["pk"]}')  # Invalidate detail cache
+        self.invalidate_list_cache()
+        self.invalidate_detail_cache(kwargs["pk"])
+        # The customer is embedded in each of its transactions
+        transaction_ids = Transaction.objects.filter(customer_id=kwargs["pk"]).values_list('pk', flat=True)
+        delete_detail_keys(f'transaction_{pk}' for pk in transaction_ids)
+        bump_generation(TransactionViewSet.cache_namespace)
+        reset_generations([customer_transactions_namespace(kwargs["pk"])])
         return response
 
     def destroy(self, request, *args, **kwargs):
         response = super().destroy(request, *args, **kwargs)
-        cache.delete('customers_list')  # Invalidate list cache
-        cache.delete(f'customer_{kwargs["pk"]}')  # Invalidate detail cache
+        self.invalidate_list_cache()
+        self.invalidate_detail_cache(kwargs["pk"])
+        reset_generations([customer_transactions_namespace(kwargs["pk"])])
         return response
 
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, *args, **kwargs):
+        filters = date_range_filter(request.query_params, 'created', 'created_at')
+        queryset = Customer.objects.filter(**filters).order_by('id')
+        return stream_export(queryset, self.export_fields, request.accepted_renderer.format, 'customers')
+
+    @action(detail=False, methods=['post'], url_path='bulk-delete')
+    def bulk_delete(self, request, *args, **kwargs):
+        serializer = CustomerIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        deleted = Customer.objects.filter(id__in=serializer.validated_data['ids']).soft_delete()
+        return Response({'deleted': deleted}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='bulk-restore')
+    def bulk_restore(self, request, *args, **kwargs):
+        serializer = CustomerIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            restored = Customer.all_objects.filter(id__in=serializer.validated_data['ids']).restore()
+        except IntegrityError:
+            return Response({'detail': 'An active customer already uses the email of a customer to restore.'},
+                            status=status.HTTP_409_CONFLICT)
+        return Response({'restored': restored}, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'])
+    def stats(self, request, *args, **kwargs):
+        customer = self.get_object()
+        return Response(CustomerStatsSerializer(CustomerDailyStats.summarize([customer.id])[0]).data)
+
+    @action(detail=False, methods=['get'], url_path='stats')
+    def bulk_stats(self, request, *args, **kwargs):
+        filters = id_list_filter(request.query_params, 'ids', 'id')
+        if not filters:
+            return Response({'error': 'No ids parameter provided.'}, status=status.HTTP_400_BAD_REQUEST)
+        customer_ids = list(Customer.objects.filter(**filters).order_by('id').values_list('id', flat=True))
+        return Response(CustomerStatsSerializer(CustomerDailyStats.summarize(customer_ids), many=True).data)
+
 
 class CustomerSearchApiView(APIView):
     serializer_class = CustomerDocumentSerializer
     document_class = CustomerDocument
+    default_size = 10
+    max_size = 100
+    max_result_window = 10000  # Elasticsearch's index.max_result_window, deeper pages need search_after
 
     def generate_q_expression(self, query):
         return Q('multi_match', query=query, fields=['name', 'email'])
 
-    def get(self, request):
-        query = self.request.query_params.get('query')
+    def get_search(self, query):
+        # Serve results from the hits' _source, fetching only the serialized fields
+        return (self.document_class.search()
+                .query(self.generate_q_expression(query))
+                .exclude('exists', field='deleted_at')
+                .source(self.serializer_class.Meta.fields)
+                .sort('_score', 'id'))
+
+    def paginate_search(self, search, params):
+        size = min(int(params.get('size', self.default_size)), self.max_size)
+        if size < 1:
+            raise ValueError
+        search_after = params.get('search_after')
+        if search_after:
+            score, pk = search_after.split(',')
+            return search.extra(search_after=[float(score), int(pk)], size=size), size
+        offset = int(params.get('from', 0))
+        if offset < 0 or offset + size > self.max_result_window:
+            raise ValueError
+        return search[offset:offset + size], size
+
+    def build_search(self, params):
+        """Return the `(search, size)` of a request, raising ValueError with the error message."""
+        query = params.get('query')
         if not query:
-            return Response({'error': 'No query parameter provided.'}, status=status.HTTP_400_BAD_REQUEST)
-        q = self.generate_q_expression(query)
-        search = self.document_class.search().query(q)
-        serializer = self.serializer_class(search.to_queryset(), many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+            raise ValueError('No query parameter provided.')
+        try:
+            return self.paginate_search(self.get_search(query), params)
+        except ValueError:
+            raise ValueError('Invalid pagination parameters.')
+
+    def format_response(self, response, size):
+        hits = list(response)
+        search_after = None
+        if len(hits) == size:
+            search_after = ','.join(str(value) for value in hits[-1].meta.sort)
+        serializer = self.serializer_class(hits, many=True)
+        return Response({
+            'count': response.hits.total.value,
+            'search_after': search_after,
+            'results': serializer.data,
+        }, status=status.HTTP_200_OK)
+
+    def get(self, request):
+        try:
+            search, size = self.build_search(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return self.format_response(search.execute(), size)
 
 
-class TransactionViewSet(GenericViewSet,
+class AsyncCustomerSearchApiView(AsyncAPIViewMixin, CustomerSearchApiView):
+    """CustomerSearchApiView querying Elasticsearch with the async client."""
+
+    async def get(self, request):
+        try:
+            search, size = self.build_search(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        raw = await get_async_elasticsearch().search(index=self.document_class._index._name, body=search.to_dict())
+        return self.format_response(SearchResponse(search, raw.body), size)
+
+
+class CustomerSuggestApiView(APIView):
+    document_class = CustomerDocument
+    source_fields = ['id', 'name', 'email']
+    default_size = 5
+    max_size = 20
+    max_prefix_length = 64
+    cache_timeout = 30  # Hot prefixes only need to survive a burst of keystrokes
+
+    def get_search(self, prefix, size):
+        return (self.document_class.search()
+                .suggest('customers', prefix, completion={'field': 'suggest', 'size': size, 'skip_duplicates': True})
+                .source(self.source_fields)
+                .extra(size=0))
+
+    def fetch_suggestions(self, prefix, size):
+        response = self.get_search(prefix, size).execute()
+        return [
+            {'id': int(option._id), 'name': option._source.name, 'email': option._source.email}
+            for option in response.suggest.customers[0].options
+        ]
+
+    def get(self, request):
+        prefix = request.query_params.get('prefix', '').strip().lower()[:self.max_prefix_length]
+        if not prefix:
+            return Response({'error': 'No prefix parameter provided.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            size = max(1, min(int(request.query_params.get('size', self.default_size)), self.max_size))
+        except ValueError:
+            return Response({'error': 'Invalid size parameter.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        cache_key = f'customer_suggest_{size}_{quote(prefix)}'
+        suggestions = cache.get(cache_key)
+        if suggestions is None:
+            suggestions = self.fetch_suggestions(prefix, size)
+            cache.set(cache_key, suggestions, timeout=self.cache_timeout)
+        return Response(suggestions, status=status.HTTP_200_OK)
+
+
+class TransactionViewSet(CachedResponseMixin,
+                         ConditionalRequestMixin,
+                         OptimizedQuerysetMixin,
+                         KeysetPaginationMixin,
+                         GenericViewSet,
                          ListModelMixin,
                          CreateModelMixin,
                          RetrieveModelMixin):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
+    # Transactions embed their customer, so renaming it must change the validators
+    last_modified_field = 'customer__updated_at'
+    cache_namespace = 'transactions'
+    cache_detail_key = 'transaction_{pk}'
+    cache_rendered = True
+    keyset_ordering = ('date', 'id')
+    export_fields = {
+        'id': 'id',
+        'customer': 'customer_id',
+        'customer_name': 'customer__name',
+        'customer_email': 'customer__email',
+        'amount': 'amount',
+        'description': 'description',
+        'date': 'date',
+    }
+    bulk_batch_size = 1000
 
-    def list(self, request, *args, **kwargs):
-        cache_key = 'transactions_list'
-        cached_data = cache.get(cache_key)
-
-        if cached_data:
-            return Response(cached_data)
-
-        response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, timeout=300)  # Cache for 5 minutes
-
-        return response
-
-    def retrieve(self, request, *args, **kwargs):
-        cache_key = f'transaction_{kwargs["pk"]}'
-        cached_data = cache.get(cache_key)
+    def use_archive(self):
+        """Read from the archive table on `?archive=true`."""
+        return self.action in READ_ACTIONS and self.request.query_params.get('archive') == 'true'
 
-        if cached_data:
-            return Response(cached_data)
+    def get_queryset(self):
+        if self.use_archive():
+            # Like the live table, soft-deleted rows are hidden
+            return self.optimize_queryset(ArchivedTransaction.objects.filter(deleted_at__isnull=True))
+        return super().get_queryset()
 
-        response = super().retrieve(request, *args, **kwargs)
-        cache.set(cache_key, response.data, timeout=300)  # Cache for 5 minutes
+    def get_serializer_class(self):
+        if self.use_archive():
+            return ArchivedTransactionSerializer
+        return super().get_serializer_class()
 
-        return response
+    def get_detail_cache_key(self, pk):
+        if self.use_archive():
+            return f'archived_transaction_{pk}'
+        return super().get_detail_cache_key(pk)
 
     def create(self, request, *args, **kwargs):
         customer_id = self.kwargs.get('customer_id')
@@ -136,9 +315,112 @@ class TransactionViewSet(GenericViewSet,
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
         headers = self.get_success_headers(serializer.data)
-        cache.delete('transactions_list')  # Invalidate list cache
+        self.invalidate_list_cache()
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request, *args, **kwargs):
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response({'detail': 'Expected a list of transactions.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        customer_id = self.kwargs.get('customer_id')
+        if customer_id is not None:
+            rows = [{**row, 'customer': customer_id} if isinstance(row, dict) else row for row in rows]
+
+        serializer = BulkTransactionSerializer(data=rows, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        # Resolve every referenced customer with a single IN query
+        customer_ids = {row['customer_id'] for row in serializer.validated_data}
+        customers = Customer.objects.only('id', 'name', 'email').in_bulk(customer_ids)
+        missing = sorted(customer_ids - customers.keys())
+        if missing:
+            return Response({'detail': 'Customer not found.', 'customers': missing},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        transactions = [
+            Transaction(customer=customers[row.pop('customer_id')], **row)
+            for row in serializer.validated_data
+        ]
+        # bulk_create skips post_save, so loyalty scores and indexing are applied once per batch
+        with db_transaction.atomic():
+            Transaction.objects.bulk_create(transactions, batch_size=self.bulk_batch_size)
+            increment_loyalty_scores(Counter(t.customer_id for t in transactions))
+            CustomerDailyStats.apply(rollup_deltas(transactions))
+            index_queue.put_on_commit(Transaction, [t.pk for t in transactions])
+
+        self.invalidate_list_cache()
+        return Response({'created': len(transactions)}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, *args, **kwargs):
+        filters = {
+            **date_range_filter(request.query_params, 'date', 'date'),
+            **id_list_filter(request.query_params, 'customer', 'customer_id'),
+        }
+        queryset = Transaction.objects.filter(**filters).order_by('date', 'id')
+        return stream_export(queryset, self.export_fields, request.accepted_renderer.format, 'transactions')
+
+
+class CustomerTransactionViewSet(TransactionViewSet):
+    """
+    One customer's transactions at `customers/<customer_id>/transactions/`.
+
+    The list is read from the `(customer_id, date, id)` index, filtered on
+    `date_from`/`date_to` and `amount_min`/`amount_max`, ordered by `ordering`
+    (`-date`, the default, or `date`) and always keyset paginated. It is cached
+    in the customer's own namespace, so only writes touching that customer
+    invalidate it. An unknown or soft-deleted customer answers 404, like
+    POST. The customer is looked up only when the list is computed: deleting
+    or restoring it resets the namespace, so cached pages never outlive it.
+    """
+    keyset_orderings = {
+        '-date': ('-date', '-id'),
+        'date': ('date', 'id'),
+    }
+    default_ordering = '-date'
+
+    @property
+    def cache_namespace(self):
+        return customer_transactions_namespace(self.kwargs['customer_id'])
+
+    @property
+    def keyset_ordering(self):
+        ordering = self.request.query_params.get('ordering', self.default_ordering)
+        if ordering not in self.keyset_orderings:
+            raise ValidationError({'ordering': f'Expected one of {", ".join(self.keyset_orderings)}.'})
+        return self.keyset_orderings[ordering]
+
+    def use_keyset_pagination(self):
+        return True
+
+    def customer_queryset(self):
+        return Customer.objects.filter(pk=self.kwargs['customer_id'])
+
+    def get_validators(self, queryset):
+        if self.action == 'list' and not self.customer_queryset().exists():
+            raise NotFound('Customer not found.')
+        return super().get_validators(queryset)
+
+    async def aget_validators(self, queryset):
+        if self.action == 'list' and not await self.customer_queryset().aexists():
+            raise NotFound('Customer not found.')
+        return await super().aget_validators(queryset)
+
+    def get_queryset(self):
+        query_params = self.request.query_params
+        filters = {
+            **date_range_filter(query_params, 'date', 'date'),
+            **decimal_range_filter(query_params, 'amount', 'amount'),
+        }
+        return super().get_queryset().filter(customer_id=self.kwargs['customer_id'], **filters)
+
+    def invalidate_list_cache(self):
+        # New transactions also show up in the list of all transactions
+        bump_generation(TransactionViewSet.cache_namespace)
+        super().invalidate_list_cache()
+
 
 class TransactionSearchView(DocumentViewSet):
     document = TransactionDocument
@@ -166,3 +448,97 @@ class TransactionSearchView(DocumentViewSet):
     }
 
     ordering = 'date'
+
+    aggregation_names = ('date_histogram', 'amount_ranges', 'top_customers', 'percentiles')
+    histogram_intervals = ('day', 'week', 'month', 'quarter', 'year')
+    default_amount_ranges = ((None, 100), (100, 1000), (1000, 10000), (10000, None))
+    default_percents = (50, 90, 99)
+    max_top_customers = 100
+
+    def parse_amount_ranges(self, value):
+        """Parse `0-100,100-1000,1000-` into (from, to) pairs, either bound may be empty."""
+        if not value:
+            return self.default_amount_ranges
+        ranges = []
+        for item in value.split(','):
+            low, high = item.split('-')
+            ranges.append((float(low) if low else None, float(high) if high else None))
+        return ranges
+
+    def add_aggregations(self, search, params):
+        names = params.get('aggs', '').split(',') if params.get('aggs') else self.aggregation_names
+        unknown = set(names) - set(self.aggregation_names)
+        if unknown:
+            raise ValueError(f'Unknown aggregations: {", ".join(sorted(unknown))}.')
+
+        # Only aggregations are returned, so no hits are fetched or sorted
+        search = search.sort().extra(size=0)
+        if 'date_histogram' in names:
+            interval = params.get('interval', 'month')
+            if interval not in self.histogram_intervals:
+                raise ValueError(f'Invalid interval, expected one of {", ".join(self.histogram_intervals)}.')
+            search.aggs.bucket('date_histogram', 'date_histogram', field='date', calendar_interval=interval) \
+                .metric('total_amount', 'sum', field='amount')
+        if 'amount_ranges' in names:
+            ranges = [
+                {key: bound for key, bound in (('from', low), ('to', high)) if bound is not None}
+                for low, high in self.parse_amount_ranges(params.get('ranges'))
+            ]
+            search.aggs.bucket('amount_ranges', 'range', field='amount', ranges=ranges) \
+                .metric('total_amount', 'sum', field='amount')
+        if 'top_customers' in names:
+            size = int(params.get('top', 10))
+            if not 1 <= size <= self.max_top_customers:
+                raise ValueError(f'Invalid top, expected 1 to {self.max_top_customers}.')
+            search.aggs.bucket('top_customers', 'terms', field='customer.id', size=size,
+                               order={'total_amount': 'desc'}) \
+                .metric('total_amount', 'sum', field='amount')
+        if 'percentiles' in names:
+            percents = [float(p) for p in params['percents'].split(',')] if params.get('percents') \
+                else list(self.default_percents)
+            search.aggs.metric('percentiles', 'percentiles', field='amount', percents=percents)
+        return search
+
+    def format_aggregations(self, response):
+        aggregations = response.aggregations
+        data = {'count': response.hits.total.value}
+        if 'date_histogram' in aggregations:
+            data['date_histogram'] = [
+                {'date': bucket.key_as_string, 'count': bucket.doc_count, 'total_amount': bucket.total_amount.value}
+                for bucket in aggregations.date_histogram.buckets
+            ]
+        if 'amount_ranges' in aggregations:
+            data['amount_ranges'] = [
+                {'from': bucket['from'] if 'from' in bucket else None, 'to': bucket['to'] if 'to' in bucket else None,
+                 'count': bucket.doc_count, 'total_amount': bucket.total_amount.value}
+                for bucket in aggregations.amount_ranges.buckets
+            ]
+        if 'top_customers' in aggregations:
+            data['top_customers'] = [
+                {'customer': bucket.key, 'count': bucket.doc_count, 'total_amount': bucket.total_amount.value}
+                for bucket in aggregations.top_customers.buckets
+            ]
+        if 'percentiles' in aggregations:
+            data['percentiles'] = aggregations.percentiles['values'].to_dict()
+        return data
+
+    def aggregations(self, request, *args, **kwargs):
+        search = self.filter_queryset(self.get_queryset())
+        try:
+            search = self.add_aggregations(search, request.query_params)
+        except ValueError as error:
+            return Response({'error': str(error) or 'Invalid aggregation parameters.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.format_aggregations(search.execute()), status=status.HTTP_200_OK)
+
+
+class AsyncCustomerViewSet(AsyncReadModelMixin, CustomerViewSet):
+    pass
+
+
+class AsyncTransactionViewSet(AsyncReadModelMixin, TransactionViewSet):
+    pass
+
+
+class AsyncCustomerTransactionViewSet(AsyncReadModelMixin, CustomerTransactionViewSet):
+    pass